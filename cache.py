@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import traceback
+
+class SliceCache:
+    """
+    slice results on disk, keyed on what went into orca: the meshes and the profiles.
+    each entry is a directory with the gcode, preview videos and a meta.json
+    """
+    def __init__(self, root="cache", max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+    def key(self, meshes, profiles):
+        """
+        meshes are stl paths, profiles are the orca json files. part order doesn't
+        matter since orca arranges the plate anyway. the bytes are hashed, split parts
+        are all written by pipeline.write_stl so the same bodies make the same files
+        """
+        digest = hashlib.sha256()
+        for mesh_hash in sorted(file_digest(x) for x in meshes):
+            digest.update(mesh_hash.encode())
+        for profile in profiles:
+            digest.update(file_digest(profile).encode())
+        return digest.hexdigest()
+    def path(self, key):
+        return os.path.join(self.root, key)
+    def get(self, key):
+        """
+        meta dict of a complete entry, or None
+        """
+        meta_path = os.path.join(self.path(key), "meta.json")
+        try:
+            with open(meta_path, "r") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        for name in meta["gcode"]:
+            if not os.path.exists(os.path.join(self.path(key), name)):
+                return None
+        os.utime(self.path(key)) # lru
+        return meta
+    def restore(self, key, meta, out):
+        """
+        copies the cached gcode into out, returns the new paths
+        """
+        paths = []
+        for name in meta["gcode"]:
+            shutil.copyfile(os.path.join(self.path(key), name), os.path.join(out, name))
+            paths.append(out + "/" + name)
+        return paths
+    def video(self, key, gcode_name):
+        """
+        path of the cached preview of one plate, None if it hasn't been rendered
+        """
+        video = os.path.join(self.path(key), os.path.splitext(gcode_name)[0] + ".mp4")
+        return video if os.path.exists(video) else None
+    def put(self, key, gcode, plates, variant):
+        """
+        stores the gcode files and their stats. plates line up with gcode
+        """
+        tmp = self.path(key) + ".tmp"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for path in gcode:
+                shutil.copyfile(path, os.path.join(tmp, os.path.basename(path)))
+            meta = {
+                "gcode": [os.path.basename(x) for x in gcode],
+                "plates": [list(x) for x in plates],
+                "variant": variant,
+                "created": time.time(),
+            }
+            with open(os.path.join(tmp, "meta.json"), "w") as meta_file:
+                json.dump(meta, meta_file)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            os.rename(tmp, self.path(key))
+        except:
+            print(traceback.format_exc())
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+    def add_video(self, key, video):
+        """
+        stores a rendered preview, and the feature summary written next to it if there
+        is one
+        """
+        if not os.path.isdir(self.path(key)) or not os.path.exists(video):
+            return
+        summary = os.path.splitext(video)[0] + ".txt"
+        try:
+            shutil.copyfile(video, os.path.join(self.path(key), os.path.basename(video)))
+            if os.path.exists(summary):
+                shutil.copyfile(summary, os.path.join(self.path(key), os.path.basename(summary)))
+        except OSError:
+            print(traceback.format_exc())
+            return
+        self.evict()
+    def evict(self):
+        """
+        removes least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or name.endswith(".tmp"):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+            total += size
+        entries.sort()
+        while total > self.max_bytes and len(entries) > 0:
+            _, size, path = entries.pop(0)
+            print("evicting", path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
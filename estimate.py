@@ -0,0 +1,74 @@
+import os
+import json
+import numpy as np
+from stats import GENERIC_DENSITY
+
+# orca defaults for anything the process profile doesn't set
+PROFILE_DEFAULTS = {
+    "layer_height": "0.2",
+    "wall_loops": "2",
+    "outer_wall_line_width": "0.42",
+    "inner_wall_line_width": "0.45",
+    "top_shell_layers": "5",
+    "bottom_shell_layers": "3",
+    "sparse_infill_density": "15%",
+}
+MIN_HISTORY = 8 # sliced prints needed before the learned model is trusted
+
+class WeightEstimator:
+    """
+    guesses what a slice will weigh from the mesh alone. the shell (walls + top/bottom)
+    is printed solid and the rest at the infill density, with the two scaled by a model
+    fitted to our own (mesh, sliced grams) history once there is enough of it
+    """
+    def __init__(self, profile="orca-input/standard.json", density=GENERIC_DENSITY, history="estimates.jsonl"):
+        with open(profile, "r") as profile_file:
+            settings = dict(PROFILE_DEFAULTS, **json.load(profile_file))
+        wall = float(settings["outer_wall_line_width"]) + (int(settings["wall_loops"]) - 1) * float(settings["inner_wall_line_width"])
+        caps = (int(settings["top_shell_layers"]) + int(settings["bottom_shell_layers"])) * float(settings["layer_height"])
+        # top and bottom are roughly a third of the surface of a typical part
+        self.shell = wall * 2 / 3 + caps / 2 / 3 # mm of solid material under each mm2 of surface
+        self.infill = float(settings["sparse_infill_density"].rstrip("%")) / 100
+        self.density = density
+        self.history = history
+        self.coefficients = None # grams = shell_cm3 * a + infill_cm3 * b + c
+        self.fit()
+    def features(self, mm3, area):
+        shell = min(abs(mm3), area * self.shell)
+        return [shell / 1000, (abs(mm3) - shell) * self.infill / 1000, 1.0]
+    def estimate(self, mm3, area):
+        """
+        grams for a mesh volume (mm3) and surface area (mm2)
+        """
+        features = self.features(mm3, area)
+        if self.coefficients is None:
+            return (features[0] + features[1]) * self.density
+        return max(float(np.dot(features, self.coefficients)), 0.0)
+    def record(self, mm3, area, grams):
+        """
+        adds a sliced result to the history and refits
+        """
+        with open(self.history, "a") as history_file:
+            history_file.write(json.dumps({"mm3": mm3, "area": area, "grams": grams}) + "\n")
+        self.fit()
+    def fit(self):
+        if not os.path.exists(self.history):
+            return
+        pairs = []
+        with open(self.history, "r") as history_file:
+            for line in history_file:
+                try:
+                    pairs.append(json.loads(line))
+                except ValueError:
+                    continue
+        if len(pairs) < MIN_HISTORY:
+            return
+        features = np.array([self.features(x["mm3"], x["area"]) for x in pairs])
+        grams = np.array([x["grams"] for x in pairs])
+        coefficients, _, _, _ = np.linalg.lstsq(features, grams, rcond=None)
+        # a negative material coefficient means the history is too narrow to say anything
+        if coefficients[0] <= 0 or coefficients[1] < 0:
+            print("estimate fit rejected", coefficients)
+            return
+        self.coefficients = coefficients
+        print("estimate fit", coefficients, "from", len(pairs), "prints")
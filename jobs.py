@@ -0,0 +1,73 @@
+import json
+import time
+import sqlite3
+import threading
+
+class JobStore:
+    """
+    print jobs on disk so a restart can pick them back up. one row per print with the
+    slack thread, the last stage that finished and the state (artifact paths etc) the
+    later stages need
+    """
+    def __init__(self, path="jobs.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS prints (
+                id INTEGER PRIMARY KEY,
+                channel TEXT,
+                thread_ts TEXT,
+                user TEXT,
+                stage TEXT,
+                status TEXT,
+                state TEXT,
+                created REAL,
+                updated REAL,
+                attempts INTEGER DEFAULT 0
+            )""")
+            # databases from before attempts were counted
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(prints)")]
+            if "attempts" not in columns:
+                self.db.execute("ALTER TABLE prints ADD COLUMN attempts INTEGER DEFAULT 0")
+    def create(self, print_id, body, state):
+        event = body['event']
+        thread_ts = event['thread_ts'] if 'thread_ts' in event else event['ts']
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO prints VALUES (?, ?, ?, ?, NULL, 'running', ?, ?, ?, 0)",
+                (print_id, event.get('channel'), thread_ts, event.get('user'), json.dumps(state), time.time(), time.time()),
+            )
+    def save(self, print_id, stage, state):
+        """
+        records that a stage finished, along with everything it produced
+        """
+        with self.lock, self.db:
+            self.db.execute("UPDATE prints SET stage = ?, state = ?, updated = ? WHERE id = ?", (stage, json.dumps(state), time.time(), print_id))
+    def attempt(self, print_id):
+        """
+        counts a run of the print starting, returns how many there have been
+        """
+        with self.lock, self.db:
+            self.db.execute("UPDATE prints SET attempts = attempts + 1, updated = ? WHERE id = ?", (time.time(), print_id))
+            return self.db.execute("SELECT attempts FROM prints WHERE id = ?", (print_id,)).fetchone()[0]
+    def finish(self, print_id, status="done"):
+        with self.lock, self.db:
+            self.db.execute("UPDATE prints SET status = ?, updated = ? WHERE id = ?", (status, time.time(), print_id))
+    def get(self, print_id):
+        """
+        (stage, status, state) of a print, None if there is no such print
+        """
+        with self.lock:
+            row = self.db.execute("SELECT stage, status, state FROM prints WHERE id = ?", (print_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+    def unfinished(self):
+        """
+        [(print id, last finished stage, state, attempts)] of prints a restart cut off
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT id, stage, state, attempts FROM prints WHERE status = 'running' ORDER BY id").fetchall()
+        return [(print_id, stage, json.loads(state), attempts) for print_id, stage, state, attempts in rows]
@@ -1,13 +1,9 @@
 import os
 import io
+import shutil
+import asyncio
 import zipfile
-import requests
 import traceback
-import threading
-from multiprocessing import Process
-import trimesh
-import time
-import cadquery as cq
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 from dotenv import load_dotenv
@@ -18,7 +14,11 @@ from usps import get_price
 from printer import Printer
 from counter import Counter
 from slicer import Slicer
-import visual
+from cache import SliceCache
+from estimate import WeightEstimator
+from scheduler import Scheduler
+from jobs import JobStore
+import pipeline
 
 load_dotenv()
 
@@ -27,12 +27,25 @@ SERIAL = os.environ.get("BAMBU_SN")
 ACCESS_CODE = os.environ.get("BAMBU_ACCESS")
 SLACK_TOKEN = os.environ.get("SLACK_TOKEN")
 APP_TOKEN = os.environ.get("APP_TOKEN")
+SLICE_WORKERS = int(os.environ.get("SLICE_WORKERS", 1))
+SLICE_TIMEOUT = float(os.environ.get("SLICE_TIMEOUT", 600))
+SPECULATIVE_SLICE = os.environ.get("SPECULATIVE_SLICE", "") not in ("", "0", "false") # plain and support run side by side on one worker, two orca processes
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024 ** 3))
+MAX_JOBS = int(os.environ.get("MAX_JOBS", 8))
+MAX_SLICES = int(os.environ.get("MAX_SLICES", 2))
+MAX_RENDERS = int(os.environ.get("MAX_RENDERS", 1))
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", 3)) # runs of a print before a restart stops resuming it
 
 app = AsyncApp(token=SLACK_TOKEN)
 printer = Printer(IP, ACCESS_CODE, SERIAL)
 print_counter = Counter("count.bin")
-slicer = Slicer()
+slicer = Slicer(workers=SLICE_WORKERS, timeout=SLICE_TIMEOUT)
+slice_cache = SliceCache(max_bytes=CACHE_MAX_BYTES)
+estimator = WeightEstimator(density=slicer.densities[0])
+scheduler = None # needs the running loop, made in main()
+jobs = JobStore()
 loop = None
+background = set() # tasks nobody awaits, kept so they aren't garbage collected
 
 @app.event("message")
 async def handle_message_events(ack, body, logger):
@@ -56,17 +69,46 @@ async def handle_message_events(ack, body, logger):
         if "cmd" in cmd:
             stack.append(gcode(body))
             stack.append(cam(body))
+        if "print queue" in cmd:
+            await queue(body)
+        if len(stack) > 0:
+            await schedule("printer", body, printer_commands, stack)
         if "print price " in cmd:
-            await price(body)
+            await schedule("price", body, price, body)
         if "print slice" in cmd:
-            await print_slice(body)
+            await schedule("slice", body, print_slice, body)
         if "print flow" in cmd:
-            await print_slice(body, flow=True)
-        if len(stack) > 0:
-            printer.alloc()
-            for i in stack:
-                await i
-            printer.dealloc()
+            await schedule("slice", body, print_slice, body, True)
+
+async def printer_commands(stack):
+    printer.alloc()
+    try:
+        for i in stack:
+            await i
+    finally:
+        printer.dealloc()
+
+async def schedule(kind, body, func, *args):
+    """
+    runs func through the scheduler, telling the thread when it has to wait
+    """
+    user = body['event'].get('user')
+    job = scheduler.submit(kind, user, func, *args, description=kind + " for <@" + str(user) + ">")
+    if job.started is None and kind in ("slice", "render"):
+        await app.client.chat_postMessage(channel=body['event']['channel'], text="queued, done in about " + minutes(scheduler.eta(job)), thread_ts=thread_ts_func(body))
+    return await job
+
+def minutes(seconds):
+    return str(max(round(seconds / 60), 1)) + "m"
+
+async def queue(body):
+    thread_ts = thread_ts_func(body)
+    status = scheduler.status()
+    if len(status) == 0:
+        await app.client.chat_postMessage(channel=body['event']['channel'], text="nothing going on", thread_ts=thread_ts)
+        return
+    lines = [f"{job.id}. {job.description}: {state}, ~{minutes(eta)}" for job, state, eta in status]
+    await app.client.chat_postMessage(channel=body['event']['channel'], text="\n".join(lines), thread_ts=thread_ts)
 
 def create_zip_archive_in_memory(
         text_content: str,
@@ -131,7 +173,7 @@ async def price(body):
         print(traceback.format_exc())
         return
     try:
-        price = get_price(zip_code, weight)
+        price = await pipeline.run_thread(get_price, zip_code, weight)
     except:
         await app.client.chat_postMessage(channel=body['event']['channel'], text="a drone hit me and i died", thread_ts=thread_ts)
         print(traceback.format_exc())
@@ -140,147 +182,297 @@ async def price(body):
         price = "death"
     await app.client.chat_postMessage(channel=body['event']['channel'], text="price: $" + str(price), thread_ts=thread_ts)
 
-def visual_runner(gcode_path):
-    save, _ = os.path.splitext(gcode_path)
-    save = save + ".mp4"
-    visual.visualize(gcode_path, save)
-    
-def visual_thread(gcode_path, body):
-    p = Process(target=visual_runner, args=[gcode_path])
-    p.start()
-    p.join()
-    save, _ = os.path.splitext(gcode_path)
-    save = save + ".mp4"
+async def preview(gcode_path, body, cache_key=None):
     thread_ts = thread_ts_func(body)
-    with open(save, "rb") as video:
-        asyncio.run_coroutine_threadsafe(
-            app.client.files_upload_v2(channel=body['event']['channel'], thread_ts=thread_ts, file=video),
-            loop,
-        ).result() # dont close file reader while reading
+    timings = pipeline.Timings()
+    try:
+        with timings.stage("render"):
+            save = slice_cache.video(cache_key, os.path.basename(gcode_path)) if cache_key else None
+            if save is None:
+                job = scheduler.submit("render", body['event'].get('user'), pipeline.run_process, pipeline.render, gcode_path, slicer.densities, description="preview of " + os.path.basename(gcode_path))
+                save = await job
+                if cache_key:
+                    await pipeline.run_thread(slice_cache.add_video, cache_key, save)
+        comment = timings.report()
+        # the feature breakdown render wrote next to the video. videos cached before
+        # there was one don't have it
+        if os.path.exists(pipeline.summary_path(save)):
+            with open(pipeline.summary_path(save), "r") as summary:
+                comment = "```" + summary.read() + "```\n" + comment
+        with open(save, "rb") as video:
+            await app.client.files_upload_v2(channel=body['event']['channel'], thread_ts=thread_ts, file=video, initial_comment=comment)
+    except Exception:
+        # not CancelledError, a render cut off by a shutdown has to stay pending
+        print(traceback.format_exc())
+
+async def finish_previews(print_id, state):
+    """
+    renders the previews a print still owes in the background, then finishes the print.
+    each comes off state["previews"] once it's posted, so a restart renders the rest
+    """
+    if len(state.get("previews", [])) == 0:
+        await pipeline.run_thread(jobs.finish, print_id)
+        return
+    for gcode_path in list(state["previews"]):
+        task = asyncio.create_task(print_preview(print_id, gcode_path, state))
+        background.add(task)
+        task.add_done_callback(background.discard)
+
+async def print_preview(print_id, gcode_path, state):
+    await preview(gcode_path, state["body"], state["cache_key"])
+    state["previews"].remove(gcode_path)
+    await pipeline.run_thread(jobs.save, print_id, PRINT_STAGES[-1], state)
+    if len(state["previews"]) == 0:
+        await pipeline.run_thread(jobs.finish, print_id)
+
+def slots_text(slots):
+    # only worth mentioning when the ams is actually used
+    if len(slots) < 2:
+        return ""
+    return " [" + ", ".join([f"slot {slot}: {round(grams, 2)}g" for slot, grams in slots]) + "]"
+
+def get_plates(gcode):
+    return [slicer.get_grams(g) for g in gcode]
+
+PRINT_STAGES = ["download", "convert", "mesh", "slice", "stats", "reply"]
 
 async def print_slice(body, flow=None):
+    print_id = print_counter.inc()
+    prefix = "prints/" + str(print_id)
+    state = {"body": body, "flow": bool(flow), "prefix": prefix, "export_path": prefix + "/export"}
+    await pipeline.run_thread(jobs.create, print_id, body, state)
+    await run_print(print_id, None, state)
+
+async def run_print(print_id, stage, state):
+    """
+    runs the stages after `stage` (None for all of them), saving the state after each
+    so a restart continues where this left off
+    """
+    # every blocking step runs on an executor so print stop etc still work mid slice
+    await pipeline.run_thread(jobs.attempt, print_id)
+    timings = pipeline.Timings()
+    done = PRINT_STAGES.index(stage) + 1 if stage is not None else 0
+    for name in PRINT_STAGES[done:]:
+        try:
+            with timings.stage(name):
+                ok = await STAGE_FUNCS[name](state, timings)
+        except asyncio.CancelledError:
+            # shutting down, the job stays running so the next start resumes it
+            raise
+        except Exception:
+            print(traceback.format_exc())
+            await app.client.chat_postMessage(channel=state["body"]['event']['channel'], text="the print blew up", thread_ts=thread_ts_func(state["body"]))
+            ok = False
+        if not ok:
+            await pipeline.run_thread(jobs.finish, print_id, "failed")
+            return
+        await pipeline.run_thread(jobs.save, print_id, name, state)
+    # the job stays running until the previews are up
+    await finish_previews(print_id, state)
+
+async def resume_print(print_id, stage, state, attempts):
+    body = state["body"]
+    if attempts >= MAX_ATTEMPTS:
+        # something in it keeps taking the bot down (oom in mesh or slice), stop trying
+        print("giving up on print", print_id, "after", attempts, "attempts")
+        await pipeline.run_thread(jobs.finish, print_id, "failed")
+        await app.client.chat_postMessage(channel=body['event']['channel'], text="this print kept crashing me, giving up on it", thread_ts=thread_ts_func(body))
+        return
+    if stage == PRINT_STAGES[-1]:
+        # replied already, only previews were left
+        print("resuming previews of print", print_id)
+        await pipeline.run_thread(jobs.attempt, print_id)
+        await finish_previews(print_id, state)
+        return
+    print("resuming print", print_id, "after", stage)
+    await app.client.chat_postMessage(channel=body['event']['channel'], text="i restarted, picking the print back up", thread_ts=thread_ts_func(body))
+    await schedule("slice", body, run_print, print_id, stage, state)
+
+async def slice_download(state, timings):
+    body = state["body"]
     thread_ts = thread_ts_func(body)
-    print_counter.inc()
-    print_id = print_counter.get()
     if 'thread_ts' in body['event']:
         message = await get_message(body['event']['channel'], body['event']['thread_ts'])
     else:
         message = body['event']
     if 'files' not in message:
         await app.client.chat_postMessage(channel=body['event']['channel'], text="nothing to slice !!", thread_ts=thread_ts)
-        return
-    headers = {
-        "Authorization": "Bearer " + SLACK_TOKEN
-    }
-    files = []
-    prefix = "prints/" + str(print_id)
-    export_path = prefix + "/export"
-    os.makedirs(export_path, exist_ok=True)
+        return False
+    prefix = state["prefix"]
+    os.makedirs(state["export_path"], exist_ok=True)
+    downloads = [] # (name, url, save path)
     for idx, file in enumerate(message['files']):
         title = file['title'] if 'title' in file else file['name'] if 'name' in file else None
         if title == None:
             continue
+        name = file['name'] if 'name' in file else title
         if title.lower().endswith('.stl'):
-            with requests.get(file['url_private'], headers=headers) as content:
-                save_path = prefix + "/" + str(idx) + ".stl"
-                with open(save_path, 'wb') as disk_file:
-                    disk_file.write(content.content)
-                files.append(save_path)
+            downloads.append((name, file['url_private'], prefix + "/" + str(idx) + ".stl"))
         elif title.lower().endswith('.step'):
-            with requests.get(file['url_private'], headers=headers) as content:
-                save_path = prefix + "/" + str(idx) + ".step"
-                with open(save_path, 'wb') as disk_file:
-                    disk_file.write(content.content)
-                try:
-                    step = cq.importers.importStep(save_path)
-                    save_path = prefix + "/" + str(idx) + ".stl"
-                    cq.exporters.export(step, save_path)
-                except:
-                    print(traceback.format_exc())
-                    await app.client.chat_postMessage(channel=body['event']['channel'], text="failed to steal step file" + file['name'], thread_ts=thread_ts)
-                else:
-                    files.append(save_path)
-    validate = [prefix + "/" + x for x in os.listdir(prefix) if x.endswith(".stl")]
-    for file in files:
-        if file not in validate:
-            name = message['files'][int(file.split("/")[-1][:-4])]['name']
-            await app.client.chat_postMessage(channel=body['event']['channel'], text="could not convert step: " + name, thread_ts=thread_ts)
+            downloads.append((name, file['url_private'], prefix + "/" + str(idx) + ".step"))
+    errors = await pipeline.download_all([(url, save_path) for _, url, save_path in downloads], SLACK_TOKEN)
+    for (name, _, _), error in zip(downloads, errors):
+        if error is not None:
+            await app.client.chat_postMessage(channel=body['event']['channel'], text="couldn't grab " + name + ": " + error, thread_ts=thread_ts)
+    state["downloads"] = [(name, save_path) for (name, _, save_path), error in zip(downloads, errors) if error is None]
+    return True
+
+async def slice_convert(state, timings):
+    body = state["body"]
+    thread_ts = thread_ts_func(body)
+    files = [(name, save_path) for name, save_path in state["downloads"] if not save_path.endswith(".step")]
+    steps = [(name, save_path, os.path.splitext(save_path)[0] + ".stl") for name, save_path in state["downloads"] if save_path.endswith(".step")]
+    converted = await pipeline.convert_steps([(save_path, stl_path) for _, save_path, stl_path in steps])
+    for (name, _, stl_path), result in zip(steps, converted):
+        if isinstance(result, Exception):
+            print(repr(result))
+            await app.client.chat_postMessage(channel=body['event']['channel'], text="failed to steal step file " + name, thread_ts=thread_ts)
+        else:
+            files.append((name, stl_path))
+    state["files"] = files
+    return True
+
+async def slice_mesh(state, timings):
+    body = state["body"]
+    thread_ts = thread_ts_func(body)
     split = []
-    for i in validate:
-        try:
-            print(validate)
-            name = message['files'][int(i.split("/")[-1][:-4])]['name']
-            mesh = trimesh.load(i)
-            #mesh.show()
-            split_mesh = mesh.split(only_watertight = False)
-            split_mesh = [m for m in split_mesh if m.faces.shape[0] > 4] # this is the minimum amount of points for a  3D object
-            #split_mesh[0].show()
-            print(split_mesh)
-            if len(split_mesh) > 1:
-                original_path, _ = os.path.splitext(i)
-                not_okay = 0
-                surfaces = 0
-                for idx, n in enumerate(split_mesh):
-                    if not n.is_watertight:
-                        not_okay += 1
-                    if not n.is_volume:
-                        surfaces += 1
-                    else:
-                        save_path = original_path + "-" + str(idx) + ".stl"
-                        n.export(save_path)
-                        split.append(save_path)
-                surface_print = ""
-                if surfaces > 0:
-                    surface_print = "\nadditionally, " + ("an object does" if surfaces == 1 else str(surfaces) + " objects do") + " not contain volume and will not be sliced."
-                if not_okay > 0:
-                    await app.client.chat_postMessage(channel=body['event']['channel'], text=("an object in " if not_okay == 1 else str(not_okay) + " objects in ") + name + (" is" if not_okay == 1 else " are") + " not manifold and may not print right" + surface_print, thread_ts=thread_ts)
-            else:
-                if not mesh.is_watertight:
-                    await app.client.chat_postMessage(channel=body['event']['channel'], text=name + " is not manifold and may not print right", thread_ts=thread_ts)
-                split.append(i)
-        except:
-            print(traceback.format_exc())
-            await app.client.chat_postMessage(channel=body['event']['channel'], text=("part of " if len(validate) > 1 else "") + "the print blew up", thread_ts=thread_ts)
-            return
-    slicer.slice(split, export_path)
-    gcode = [export_path + "/" + x for x in os.listdir(export_path) if x.endswith(".gcode")]
-    if gcode == []: # try again with supports
-        slicer.slice(split, export_path, support=True)
-        gcode = [export_path + "/" + x for x in os.listdir(export_path) if x.endswith(".gcode")]
-    for gcode_path in gcode:
-        threading.Thread(target=visual_thread, args=[gcode_path, body]).start()
-    plates = []
-    for g in gcode:
-        filament, time = slicer.get_grams(g)
-        plates.append((filament, time))
+    mesh_mm3 = 0
+    mesh_area = 0
+    reports = await asyncio.gather(*[pipeline.check_mesh(path) for _, path in state["files"]], return_exceptions=True)
+    for (name, _), report in zip(state["files"], reports):
+        if isinstance(report, Exception):
+            print(repr(report))
+            await app.client.chat_postMessage(channel=body['event']['channel'], text=("part of " if len(state["files"]) > 1 else "") + "the print blew up", thread_ts=thread_ts)
+            return False
+        split += report["parts"]
+        mesh_mm3 += report["mm3"]
+        mesh_area += report["area"]
+        before = sum(x["faces_before"] for x in report["bodies"])
+        after = sum(x["faces"] for x in report["bodies"])
+        if before != after:
+            print(name, before, "->", after, "faces")
+            await app.client.chat_postMessage(channel=body['event']['channel'], text="cleaned up " + name + ": " + str(before) + " -> " + str(after) + " faces", thread_ts=thread_ts)
+        if report["split"]:
+            print(name, len(report["bodies"]), "bodies", sum(x["faces"] for x in report["bodies"]), "faces")
+            not_okay = len([x for x in report["bodies"] if not x["watertight"]])
+            surfaces = len([x for x in report["bodies"] if not x["volume"]])
+            surface_print = ""
+            if surfaces > 0:
+                surface_print = "\nadditionally, " + ("an object does" if surfaces == 1 else str(surfaces) + " objects do") + " not contain volume and will not be sliced."
+            if not_okay > 0:
+                await app.client.chat_postMessage(channel=body['event']['channel'], text=("an object in " if not_okay == 1 else str(not_okay) + " objects in ") + name + (" is" if not_okay == 1 else " are") + " not manifold and may not print right" + surface_print, thread_ts=thread_ts)
+        elif not report["watertight"]:
+            await app.client.chat_postMessage(channel=body['event']['channel'], text=name + " is not manifold and may not print right", thread_ts=thread_ts)
+    state["parts"] = split
+    state["mesh_mm3"] = mesh_mm3
+    state["mesh_area"] = mesh_area
+    if state["flow"] and mesh_mm3 > 0: # rough quote from the mesh while orca runs
+        task = asyncio.create_task(flow_price(body, estimator.estimate(mesh_mm3, mesh_area), estimate=True, state=state))
+        background.add(task)
+        task.add_done_callback(background.discard)
+    return True
+
+async def slice_slice(state, timings):
+    split = state["parts"]
+    export_path = state["export_path"]
+    # anything here is from a slice a restart cut off
+    await pipeline.run_thread(shutil.rmtree, export_path, ignore_errors=True)
+    os.makedirs(export_path, exist_ok=True)
+    cache_key = await pipeline.run_thread(slice_cache.key, split, slicer.profiles)
+    cached = await pipeline.run_thread(slice_cache.get, cache_key)
+    if cached is not None: # sliced this exact thing before
+        print("cache hit", cache_key)
+        gcode = await pipeline.run_thread(slice_cache.restore, cache_key, cached, export_path)
+        variant = cached["variant"]
+    elif SPECULATIVE_SLICE: # both at once, the support slice is thrown away if it isn't needed
+        variant = await slicer.slice_speculative(split, export_path)
+        gcode = sorted([export_path + "/" + x for x in os.listdir(export_path) if x.endswith(".gcode")])
+    else:
+        variant = "plain"
+        await slicer.slice_async(split, export_path)
+        gcode = sorted([export_path + "/" + x for x in os.listdir(export_path) if x.endswith(".gcode")])
+        if gcode == []: # try again with supports
+            variant = "support"
+            await slicer.slice_async(split, export_path, support=True)
+            gcode = sorted([export_path + "/" + x for x in os.listdir(export_path) if x.endswith(".gcode")])
+    state["cache_key"] = cache_key
+    state["cached_plates"] = cached["plates"] if cached is not None else None
+    state["gcode"] = gcode
+    state["variant"] = variant
+    return True
+
+async def slice_stats(state, timings):
+    gcode = state["gcode"]
+    if state["cached_plates"] is not None:
+        plates = [tuple(x) for x in state["cached_plates"]]
+    else:
+        plates = await pipeline.run_thread(get_plates, gcode)
+        if len(gcode) > 0:
+            await pipeline.run_thread(slice_cache.put, state["cache_key"], gcode, plates, state["variant"])
+        if len(plates) > 0 and state["mesh_mm3"] > 0:
+            await pipeline.run_thread(estimator.record, state["mesh_mm3"], state["mesh_area"], sum([x[0] for x in plates]))
+    state["plates"] = plates
+    return True
+
+async def slice_reply(state, timings):
+    body = state["body"]
+    thread_ts = thread_ts_func(body)
+    plates = state["plates"]
+    # rendered by finish_previews once this stage is saved
+    state["previews"] = list(state["gcode"])
     if len(plates) == 0:
         plates_response = "i dropped the print"
     elif len(plates) == 1:
-        plates_response = plates[0][1] + ", *" + str(round(plates[0][0], 2)) + "g*"
+        plates_response = plates[0][1] + ", *" + str(round(plates[0][0], 2)) + "g*" + slots_text(plates[0][2])
     else:
-        plates_response = "\n".join([f"Plate {str(idx + 1)}: {x[1]} ({round(x[0], 2)}g)" for idx, x in enumerate(plates)])
+        plates_response = "\n".join([f"Plate {str(idx + 1)}: {x[1]} ({round(x[0], 2)}g)" + slots_text(x[2]) for idx, x in enumerate(plates)])
         plates_response += "\nTotal: *" + str(round(sum([x[0] for x in plates]), 2)) + "g*"
+    if len(plates) != 0 and state["variant"] == "support":
+        plates_response += "\n_needed supports_"
+    plates_response += "\n_" + timings.report() + "_"
     await app.client.chat_postMessage(channel=body['event']['channel'], text=plates_response, thread_ts=thread_ts)
-    if flow and len(plates) != 0:
-        args = body['event']['text'].split(" ")
-        args = [x.strip() for x in args if (x.strip() != "print" and x.strip() != "flow")]
-        try:
-            int(args[0]) # validate its a number, but keep leading zeros
-            zip_code = args[0]
-            weight = sum([x[0] for x in plates]) / 28.35 # grams -> ounces
-            weight = weight / 16 # ounces -> pounds
-        except:
+    if state["flow"] and len(plates) != 0:
+        state["priced"] = True # a late estimate would land after the real price, see flow_price
+        await flow_price(body, sum([x[0] for x in plates]))
+    return True
+
+STAGE_FUNCS = {
+    "download": slice_download,
+    "convert": slice_convert,
+    "mesh": slice_mesh,
+    "slice": slice_slice,
+    "stats": slice_stats,
+    "reply": slice_reply,
+}
+
+async def flow_price(body, grams, estimate=False, state=None):
+    thread_ts = thread_ts_func(body)
+    args = body['event']['text'].split(" ")
+    args = [x.strip() for x in args if (x.strip() != "print" and x.strip() != "flow")]
+    try:
+        int(args[0]) # validate its a number, but keep leading zeros
+        zip_code = args[0]
+        weight = grams / 28.35 # grams -> ounces
+        weight = weight / 16 # ounces -> pounds
+    except:
+        if not estimate: # the estimate is quiet, the real price will complain
             await app.client.chat_postMessage(channel=body['event']['channel'], text="failed to parse! birds cant read", thread_ts=thread_ts)
-            print(traceback.format_exc())
-            return
-        try:
-            price = get_price(zip_code, weight)
-        except:
+        print(traceback.format_exc())
+        return
+    try:
+        price = await pipeline.run_thread(get_price, zip_code, weight)
+    except:
+        if not estimate:
             await app.client.chat_postMessage(channel=body['event']['channel'], text="a drone hit me and i died", thread_ts=thread_ts)
-            print(traceback.format_exc())
-            return
-        if price is None:
-            price = "death"
+        print(traceback.format_exc())
+        return
+    if price is None:
+        price = "death"
+    if estimate:
+        if state is not None and state.get("priced"):
+            return # a slice cache hit got the real price out first
+        await app.client.chat_postMessage(channel=body['event']['channel'], text="estimate: ~" + str(round(grams)) + "g, ~$" + str(price) + " _(slicing to check)_", thread_ts=thread_ts)
+    else:
         await app.client.chat_postMessage(channel=body['event']['channel'], text="price: $" + str(price), thread_ts=thread_ts)
 
 async def home(body):
@@ -333,11 +525,15 @@ async def off(body):
     await app.client.chat_postMessage(channel=body['event']['channel'], text="printer stopped", thread_ts=thread_ts)
 
 async def main():
-    global loop
+    global loop, scheduler
     loop = asyncio.get_running_loop()
+    scheduler = Scheduler({"slice": MAX_SLICES, "render": MAX_RENDERS}, max_jobs=MAX_JOBS)
+    for print_id, stage, state, attempts in await pipeline.run_thread(jobs.unfinished):
+        task = asyncio.create_task(resume_print(print_id, stage, state, attempts))
+        background.add(task)
+        task.add_done_callback(background.discard)
     handler = AsyncSocketModeHandler(app, APP_TOKEN)
     await handler.start_async()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
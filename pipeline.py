@@ -0,0 +1,375 @@
+import os
+import time
+import shutil
+import struct
+import tempfile
+import asyncio
+import functools
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import aiohttp
+import numpy as np
+import trimesh
+import cadquery as cq
+import visual
+from cache import file_digest
+from stats import read_stats, parse_list, GENERIC_DENSITY
+
+# io and anything that releases the gil goes to threads, cadquery/trimesh/matplotlib
+# work goes to processes so the event loop never waits on them
+PROCESS_WORKERS = int(os.environ.get("PIPELINE_PROCESSES", 2))
+THREADS = ThreadPoolExecutor(max_workers=int(os.environ.get("PIPELINE_THREADS", 8)))
+PROCESSES = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+
+MAX_DOWNLOAD_BYTES = int(os.environ.get("MAX_DOWNLOAD_BYTES", 200 * 1024 ** 2))
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", 8))
+CHUNK_SIZE = 256 * 1024
+
+# step tessellation. bigger tolerances make smaller stls that slice faster
+STEP_TOLERANCE = float(os.environ.get("STEP_TOLERANCE", 0.1)) # mm
+STEP_ANGULAR_TOLERANCE = float(os.environ.get("STEP_ANGULAR_TOLERANCE", 0.1)) # radians
+STEP_CACHE = os.environ.get("STEP_CACHE", "step-cache")
+STEP_CACHE_MAX_BYTES = int(os.environ.get("STEP_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+
+PREVIEW_DPI = int(os.environ.get("PREVIEW_DPI", 150)) # 6.4x4.8in, so 960x720 at 150
+PREVIEW_GRAPHICS = os.environ.get("PREVIEW_GRAPHICS", "raster") # or matplotlib
+PREVIEW_FRAMES_BY = os.environ.get("PREVIEW_FRAMES_BY", "extrusion") # moves, extrusion or layer
+PREVIEW_MAX_MOVES = int(os.environ.get("PREVIEW_MAX_MOVES", 0)) or None # moves one frame may add
+# pixels a dropped move may be off by, 0 keeps all. off for raster, which samples the
+# path by length so fewer moves don't make it faster
+PREVIEW_LOD = float(os.environ.get("PREVIEW_LOD", 0.5 if PREVIEW_GRAPHICS == "matplotlib" else 0))
+
+session = None # shared so connections to slack are reused
+
+# optional cleanup before slicing. decimation needs trimesh's fast_simplification extra
+MESH_REPAIR = os.environ.get("MESH_REPAIR", "") not in ("", "0", "false")
+MESH_FACE_BUDGET = int(os.environ.get("MESH_FACE_BUDGET", 200000)) # per body
+MESH_MAX_DEVIATION = float(os.environ.get("MESH_MAX_DEVIATION", 0.05)) # mm
+DEVIATION_SAMPLES = 2000
+
+# split meshes with at least this many faces are checked across the process pool,
+# smaller ones in the process that split them since saving the bodies costs more
+MESH_PARALLEL_FACES = int(os.environ.get("MESH_PARALLEL_FACES", 100000))
+
+# binary stl triangle record: normal, three vertices, attribute byte count
+STL_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+STL_HEADER = b"knox binary stl".ljust(80, b" ")
+
+class DownloadError(Exception):
+    pass
+
+class Timings:
+    """
+    wall time of each pipeline stage, reported back with the result
+    """
+    def __init__(self):
+        self.stages = []
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.time() - start))
+    def report(self):
+        return ", ".join([f"{name} {round(seconds, 1)}s" for name, seconds in self.stages])
+
+async def run_thread(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(THREADS, functools.partial(func, *args, **kwargs))
+
+async def run_process(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(PROCESSES, functools.partial(func, *args, **kwargs))
+
+def get_session():
+    global session
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=DOWNLOAD_CONNECTIONS))
+    return session
+
+async def download(url, token, save_path, max_bytes=MAX_DOWNLOAD_BYTES):
+    """
+    streams a slack file to disk, checking the size as it goes and the header at the end
+    """
+    try:
+        async with get_session().get(url, headers={"Authorization": "Bearer " + token}) as response:
+            if response.status != 200:
+                raise DownloadError("slack said " + str(response.status))
+            if response.content_length is not None and response.content_length > max_bytes:
+                raise DownloadError("too big")
+            size = 0
+            with open(save_path, 'wb') as disk_file:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadError("too big")
+                    disk_file.write(chunk)
+        error = validate_model(save_path)
+        if error is not None:
+            raise DownloadError(error)
+    except:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise
+    return save_path
+
+async def download_all(downloads, token):
+    """
+    downloads [(url, save_path)] at once. returns an error (or None) per download
+    """
+    results = await asyncio.gather(*[download(url, token, save_path) for url, save_path in downloads], return_exceptions=True)
+    errors = []
+    for result in results:
+        if isinstance(result, DownloadError):
+            errors.append(str(result))
+        elif isinstance(result, Exception):
+            errors.append("download failed")
+            print(repr(result))
+        else:
+            errors.append(None)
+    return errors
+
+def validate_model(path):
+    """
+    None if the file looks like the stl/step its name says, otherwise why not
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as model_file:
+        head = model_file.read(84)
+    if path.lower().endswith(".step"):
+        if not head.lstrip().startswith(b"ISO-10303-21"):
+            return "not a step file"
+        return None
+    # binary stl: 80 byte header, triangle count, 50 bytes per triangle
+    if len(head) == 84 and 84 + struct.unpack("<I", head[80:84])[0] * 50 == size:
+        return None
+    if head.lstrip().lower().startswith(b"solid"):
+        return None
+    return "not an stl file"
+
+# stages. these block, call them through run_thread/run_process
+
+def convert_step(step_path, stl_path, tolerance=STEP_TOLERANCE, angular_tolerance=STEP_ANGULAR_TOLERANCE, cache=STEP_CACHE):
+    """
+    tessellates a step file. the same step at the same tolerances is only converted once
+    """
+    cached = None
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+        cached = os.path.join(cache, f"{file_digest(step_path)}-{tolerance}-{angular_tolerance}.stl")
+        try:
+            os.utime(cached) # lru
+            shutil.copyfile(cached, stl_path)
+            return stl_path
+        except FileNotFoundError:
+            pass # not cached, or evicted just now
+    step = cq.importers.importStep(step_path)
+    cq.exporters.export(step, stl_path, tolerance=tolerance, angularTolerance=angular_tolerance)
+    if cached is not None:
+        # the stl is done, filling the cache is best effort. conversions of the same
+        # step can run at once, so each writes its own temp file
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=cache, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(stl_path, tmp)
+            os.replace(tmp, cached)
+            tmp = None
+            evict_steps(cache)
+        except OSError:
+            print(traceback.format_exc())
+        finally:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+    return stl_path
+
+async def convert_steps(steps, **kwargs):
+    """
+    converts [(step_path, stl_path)] in parallel on the process pool. returns the stl
+    path or the exception per step
+    """
+    return await asyncio.gather(*[run_process(convert_step, step_path, stl_path, **kwargs) for step_path, stl_path in steps], return_exceptions=True)
+
+def evict_steps(cache, max_bytes=STEP_CACHE_MAX_BYTES):
+    entries = []
+    for name in os.listdir(cache):
+        path = os.path.join(cache, name)
+        if name.endswith(".stl"):
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                pass
+    entries.sort()
+    total = sum(x[1] for x in entries)
+    while total > max_bytes and len(entries) > 0:
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass # another conversion evicted it
+        total -= size
+
+async def check_mesh(path, repair=MESH_REPAIR):
+    """
+    splits a mesh into bodies and checks them across the process pool, writing the
+    printable ones next to it. returns what happened so the caller can tell the user:
+    a "bodies" list with one dict per body plus the totals. with repair each body is
+    cleaned up and decimated first (see repair_body)
+    """
+    count, bodies, watertight, mm3, area = await run_process(split_mesh, path, repair)
+    report = {"bodies": bodies, "parts": [], "split": count > 1, "not_okay": 0, "surfaces": 0, "watertight": watertight, "mm3": mm3, "area": area}
+    if len(bodies) == 0:
+        report["parts"].append(path)
+        return report
+    if "raw" in bodies[0]:
+        # biggest bodies first so the batches come out about even. the workers load
+        # their bodies from the arrays split_mesh saved, only the paths are pickled
+        order = sorted(bodies, key=lambda body: -body["faces_before"])
+        batches = [order[n::min(PROCESS_WORKERS, len(order))] for n in range(min(PROCESS_WORKERS, len(order)))]
+        results = await asyncio.gather(*[run_process(check_bodies, batch, repair) for batch in batches])
+        report["bodies"] = sorted([body for result in results for body in result], key=lambda body: body["index"])
+    if not report["split"]:
+        # a single body is always sliced, same as without repair
+        body = report["bodies"][0]
+        report["watertight"] = body["watertight"]
+        report["parts"].append(body["path"] if body["path"] is not None else path)
+        return report
+    for body in report["bodies"]:
+        if not body["watertight"]:
+            report["not_okay"] += 1
+        if not body["volume"]:
+            report["surfaces"] += 1
+        else:
+            report["parts"].append(body["path"])
+    return report
+
+def split_mesh(path, repair=False, parallel_faces=MESH_PARALLEL_FACES):
+    """
+    loads a mesh once and splits it into bodies. returns the number of bodies, a dict
+    per body, whether the whole thing is watertight, and its volume (mm3) and surface
+    area (mm2). a single body isn't checked without repair. with repair or at least
+    parallel_faces faces every body is saved as raw arrays ("raw") and left for
+    check_bodies on the pool, so they never go through a pickle. smaller meshes are
+    checked and written here
+    """
+    mesh = trimesh.load(path, force="mesh")
+    bodies = mesh.split(only_watertight = False)
+    bodies = [m for m in bodies if m.faces.shape[0] > 4] # this is the minimum amount of points for a  3D object
+    original_path, _ = os.path.splitext(path)
+    report = []
+    parallel = repair or len(mesh.faces) >= parallel_faces
+    if len(bodies) > 1 or repair:
+        for idx, body in enumerate(bodies):
+            save_path = original_path + "-" + str(idx) + ".stl"
+            result = {"index": idx, "faces_before": len(body.faces), "decimated": False, "path": save_path}
+            if parallel:
+                result["raw"] = original_path + "-" + str(idx) + ".npz"
+                np.savez(result["raw"], vertices=body.vertices, faces=body.faces)
+            else:
+                check_body(body, result)
+            report.append(result)
+    return len(bodies), report, mesh.is_watertight, abs(float(mesh.volume)), float(mesh.area)
+
+def check_bodies(batch, repair=False):
+    """
+    checks a batch of the bodies split_mesh saved, repairing them first with repair.
+    each is loaded from its raw arrays and the stl is written if it has volume
+    """
+    report = []
+    for result in batch:
+        raw = result.pop("raw")
+        with np.load(raw) as arrays:
+            body = trimesh.Trimesh(vertices=arrays["vertices"], faces=arrays["faces"], process=False)
+        os.remove(raw)
+        if repair:
+            body, result["decimated"] = repair_body(body)
+        report.append(check_body(body, result))
+    return report
+
+def check_body(body, result):
+    """
+    fills in whether a body is watertight and has volume, writing it to result["path"]
+    if it does. path is None for bodies that can't be sliced
+    """
+    result.update({"faces": len(body.faces), "watertight": body.is_watertight, "volume": body.is_volume})
+    if result["volume"]:
+        write_stl(result["path"], body.vertices, body.faces)
+    else:
+        result["path"] = None
+    return result
+
+def repair_body(body, face_budget=MESH_FACE_BUDGET, max_deviation=MESH_MAX_DEVIATION):
+    """
+    merges duplicate vertices, fills small holes and fixes normals, then decimates
+    bodies over the face budget. the decimated body is only kept if no sampled point
+    of the original is further than max_deviation from it. returns (body, decimated)
+    """
+    try:
+        body.merge_vertices()
+        body.update_faces(body.nondegenerate_faces())
+        body.remove_unreferenced_vertices()
+        trimesh.repair.fill_holes(body)
+        trimesh.repair.fix_normals(body)
+    except:
+        print(traceback.format_exc())
+    if len(body.faces) <= face_budget:
+        return body, False
+    try:
+        simplified = body.simplify_quadric_decimation(face_count=face_budget)
+    except ImportError:
+        return body, False
+    samples = body.vertices[np.random.default_rng(0).choice(len(body.vertices), min(DEVIATION_SAMPLES, len(body.vertices)), replace=False)]
+    try:
+        _, distance, _ = trimesh.proximity.closest_point(simplified, samples)
+    except:
+        print(traceback.format_exc())
+        return body, False
+    if distance.max() > max_deviation:
+        print("decimation moved the surface", distance.max(), "mm, keeping", len(body.faces), "faces")
+        return body, False
+    return simplified, True
+
+def write_stl(path, vertices, faces):
+    """
+    binary stl in one write instead of trimesh's exporter
+    """
+    triangles = np.asarray(vertices, dtype=np.float32)[np.asarray(faces)]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths == 0, 1, lengths)
+    records = np.zeros(len(triangles), dtype=STL_DTYPE)
+    records["normal"] = normals
+    records["vertices"] = triangles
+    with open(path, "wb") as stl_file:
+        stl_file.write(STL_HEADER)
+        stl_file.write(struct.pack("<I", len(records)))
+        stl_file.write(records.tobytes())
+    return path
+
+def filament(gcode_path, densities=()):
+    """
+    (diameter, density) the plate was sliced with. the density is the average of the
+    slots it uses, weighted by how much of each
+    """
+    stats = read_stats(gcode_path)
+    slots = stats.slots(densities)
+    cm3 = sum(x[1] for x in slots)
+    density = sum(x[2] for x in slots) / cm3 if cm3 > 0 else GENERIC_DENSITY
+    diameter = (parse_list(stats.config.get("filament_diameter", stats.header.get("filament_diameter", ""))) or [1.75])[0]
+    return diameter, density
+
+def render(gcode_path, densities=()):
+    """
+    renders the preview video and writes the feature breakdown of the same read next
+    to it as a .txt (see summary_path)
+    """
+    save, _ = os.path.splitext(gcode_path)
+    save = save + ".mp4"
+    diameter, density = filament(gcode_path, densities)
+    breakdown = visual.visualize(gcode_path, save, dpi=PREVIEW_DPI, graphics=PREVIEW_GRAPHICS, by=PREVIEW_FRAMES_BY, max_moves=PREVIEW_MAX_MOVES, lod=PREVIEW_LOD, report=True, diameter=diameter, density=density)
+    with open(summary_path(save), "w") as summary_file:
+        summary_file.write(breakdown.summary())
+    return save
+
+def summary_path(video):
+    return os.path.splitext(video)[0] + ".txt"
@@ -0,0 +1,130 @@
+import time
+import asyncio
+import itertools
+import traceback
+
+# lower goes first when several job types are waiting on the global limit
+PRIORITY = {"printer": 0, "price": 1, "slice": 2, "render": 3}
+# seconds, until a few jobs of the type have finished
+GUESS = {"printer": 5, "price": 3, "slice": 180, "render": 120}
+
+class Job:
+    """
+    one unit of bot work. await it for the result of func
+    """
+    ids = itertools.count(1)
+    def __init__(self, kind, user, func, args, description):
+        self.id = next(Job.ids)
+        self.kind = kind
+        self.user = user
+        self.func = func
+        self.args = args
+        self.description = description or kind
+        self.created = time.time()
+        self.started = None
+        self.future = asyncio.get_running_loop().create_future()
+    def __await__(self):
+        return self.future.__await__()
+
+class Scheduler:
+    """
+    runs jobs with a cap per job type and overall. printer commands go first, and
+    within a type users take turns so one person's burst doesn't starve everyone
+    """
+    def __init__(self, limits=None, max_jobs=8):
+        self.limits = dict({"printer": 1, "price": 4, "slice": 2, "render": 1}, **(limits or {}))
+        self.max_jobs = max_jobs
+        self.pending = []
+        self.running = []
+        self.served = {} # user -> when they last got a job started
+        self.durations = {} # kind -> moving average seconds
+        self.tasks = set()
+    def submit(self, kind, user, func, *args, description=None):
+        """
+        queues an async func(*args). returns the Job
+        """
+        if kind not in self.limits:
+            raise ValueError("unknown job type " + str(kind))
+        job = Job(kind, user, func, args, description)
+        self.pending.append(job)
+        self.dispatch()
+        return job
+    def dispatch(self):
+        while len(self.running) < self.max_jobs:
+            job = self.next_job()
+            if job is None:
+                return
+            self.pending.remove(job)
+            self.running.append(job)
+            self.served[job.user] = time.time()
+            job.started = time.time()
+            task = asyncio.create_task(self.run(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+    def next_job(self):
+        for kind in sorted(self.limits, key=lambda x: PRIORITY.get(x, len(PRIORITY))):
+            if len([x for x in self.running if x.kind == kind]) >= self.limits[kind]:
+                continue
+            order = self.order(kind)
+            if len(order) > 0:
+                return order[0]
+        return None
+    def order(self, kind):
+        """
+        pending jobs of a type in the order they'll start: the user served longest ago
+        first, each user's own jobs fifo
+        """
+        queues = {}
+        for job in self.pending:
+            if job.kind == kind:
+                queues.setdefault(job.user, []).append(job)
+        users = sorted(queues, key=lambda user: (self.served.get(user, 0), queues[user][0].id))
+        order = []
+        while len(users) > 0:
+            for user in list(users):
+                order.append(queues[user].pop(0))
+                if len(queues[user]) == 0:
+                    users.remove(user)
+        return order
+    async def run(self, job):
+        try:
+            result = await job.func(*job.args)
+        except Exception as e:
+            print(traceback.format_exc())
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            # cancelled (shutdown), the awaiters would otherwise wait forever
+            if not job.future.done():
+                job.future.cancel()
+            seconds = time.time() - job.started
+            average = self.durations.get(job.kind)
+            self.durations[job.kind] = seconds if average is None else average * 0.8 + seconds * 0.2
+            self.running.remove(job)
+            self.dispatch()
+    def duration(self, kind):
+        return self.durations.get(kind, GUESS.get(kind, 60))
+    def eta(self, job):
+        """
+        rough seconds until a job finishes
+        """
+        average = self.duration(job.kind)
+        if job.started is not None:
+            return max(average - (time.time() - job.started), 0)
+        limit = max(self.limits.get(job.kind, 1), 1)
+        ahead = self.order(job.kind).index(job)
+        running = [max(average - (time.time() - x.started), 0) for x in self.running if x.kind == job.kind]
+        # the slot this job gets frees up when the running job closest to done finishes
+        wait = min(running) if len(running) >= limit else 0
+        return wait + (ahead // limit) * average + average
+    def status(self):
+        """
+        [(job, "running"/"waiting", eta seconds)] in the order they'll finish about
+        """
+        jobs = [(job, "running", self.eta(job)) for job in self.running]
+        for kind in sorted(self.limits, key=lambda x: PRIORITY.get(x, len(PRIORITY))):
+            jobs += [(job, "waiting", self.eta(job)) for job in self.order(kind)]
+        return jobs
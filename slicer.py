@@ -1,29 +1,197 @@
 import os
+import shutil
+import asyncio
+import traceback
 import subprocess
+from stats import read_stats, load_density, GENERIC_DENSITY
+
+class SliceJob:
+    """
+    one queued orca run. await it for the return code (None if cancelled or timed out)
+    """
+    def __init__(self, paths, out, support, timeout):
+        self.paths = list(paths)
+        self.out = str(out)
+        self.support = support
+        self.timeout = timeout
+        self.future = asyncio.get_running_loop().create_future()
+        self.process = None
+        self.cancelled = False
+        self.timed_out = False
+        self.started = False # a worker picked it up, it may have a process
+        self.stopped = asyncio.Event() # set once its process (if any) is reaped
+    def cancel(self):
+        self.cancelled = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+        if not self.future.done():
+            self.future.set_result(None)
+    def __await__(self):
+        return self.future.__await__()
 
 class Slicer:
-    def __init__(self):
-        pass
+    plain = "orca-input/standard.json"
+    support = "orca-input/standard-support.json"
+    machine = "orca-input/a1.json"
+    def __init__(self, filaments=("orca-input/pla.json",), workers=1, timeout=600, appimage="./OrcaSlicer.AppImage", extract_dir="orca-slicer"):
+        self.filaments = list(filaments)
+        # read once, profiles don't change while the bot runs
+        self.densities = []
+        for path in self.filaments:
+            density = load_density(path)
+            self.densities.append(density if density is not None else GENERIC_DENSITY)
+        print("filament densities", self.densities)
+        # everything that changes what orca outputs
+        self.profiles = [self.plain, self.support, self.machine] + self.filaments
+        self.workers = max(int(workers), 1)
+        self.timeout = timeout
+        self.appimage = appimage
+        self.extract_dir = extract_dir
+        self.executable = self.prepare()
+        self.queue = None
+        self.tasks = []
+    def prepare(self):
+        """
+        extracts the appimage once so each slice skips the squashfs mount
+        """
+        apprun = os.path.join(self.extract_dir, "AppRun")
+        if os.path.exists(apprun):
+            return os.path.abspath(apprun)
+        if not os.path.exists(self.appimage):
+            return self.appimage
+        tmp = self.extract_dir + ".tmp"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            print("extracting", self.appimage)
+            subprocess.run([os.path.abspath(self.appimage), "--appimage-extract"], cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+            os.rename(os.path.join(tmp, "squashfs-root"), self.extract_dir)
+        except:
+            print(traceback.format_exc())
+            return self.appimage
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return os.path.abspath(apprun)
     def get_grams(self, path):
-        with open(path, "r") as gcode_file:
-            gcode = gcode_file.readlines()
-        filament_line = None
-        filament_match_string = "; filament used [cm3] ="
-        time_line = None
-        time_match_string = "total estimated time:"
-        for i in gcode:
-            if filament_match_string in i:
-                filament_line = i
-            if time_match_string in i:
-                time_line = i
-        filament = float(filament_line[len(filament_match_string):]) * 1.26 # generic g/cm3
-        time = time_line.split(":")[2].strip()
-        print(filament, time)
-        return (filament, time)
+        stats = read_stats(path)
+        slots = [(slot, grams) for slot, _, grams in stats.slots(self.densities)]
+        filament = sum(x[1] for x in slots)
+        time = stats.time()
+        print(filament, time, slots)
+        return (filament, time, slots)
+    def get_stats(self, path):
+        return read_stats(path)
+    def command(self, paths, out, support=False):
+        settings = self.support if support else self.plain
+        return [self.executable, "--load-settings", settings + ";" + self.machine, "--load-filaments", ";".join(self.filaments), "--arrange", "1", "--orient", "1", "--slice", "0", "--outputdir", str(out)] + [str(x) for x in paths]
     def slice(self, paths, out, support=False):
-        # yes this is gross
-        # doing it anyways
-        if support:
-            subprocess.run("./OrcaSlicer.AppImage --load-settings \"orca-input/standard-support.json;orca-input/a1.json\" --load-filaments \"orca-input/pla.json\" --arrange 1 --orient 1 --arrange 1 --slice 0 --outputdir " + str(out) + " " + " ".join(paths), shell=True, cwd=os.getcwd())
+        """
+        blocking slice, for use outside the event loop
+        """
+        try:
+            return subprocess.run(self.command(paths, out, support), cwd=os.getcwd(), timeout=self.timeout).returncode
+        except subprocess.TimeoutExpired:
+            print("slice timed out", out)
+            return None
+    def submit(self, paths, out, support=False, timeout=None):
+        """
+        queues a slice on the worker pool, returns the SliceJob to await or cancel
+        """
+        return self.submit_together([(paths, out, support)], timeout)[0]
+    def submit_together(self, slices, timeout=None):
+        """
+        queues (paths, out, support) slices as one entry: the worker that takes it runs
+        all of their orca processes at once, so nothing else lands between them even
+        with a single worker. returns the SliceJobs in the same order
+        """
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        jobs = [SliceJob(paths, out, support, self.timeout if timeout is None else timeout) for paths, out, support in slices]
+        self.queue.put_nowait(jobs)
+        return jobs
+    async def slice_async(self, paths, out, support=False, timeout=None):
+        return await self.submit(paths, out, support, timeout)
+    async def slice_speculative(self, paths, out):
+        """
+        slices without and with supports at the same time, keeps the no-support
+        result when it's valid. returns "plain", "support" or None. both take one
+        queue entry, so they run side by side whatever the number of workers
+        """
+        variants = {"plain": os.path.join(str(out), "plain"), "support": os.path.join(str(out), "support")}
+        for variant_out in variants.values():
+            os.makedirs(variant_out, exist_ok=True)
+        plain, support = self.submit_together([(paths, variants["plain"], False), (paths, variants["support"], True)])
+        jobs = {"plain": plain, "support": support}
+        winner = None
+        await jobs["plain"]
+        if len(gcode_files(variants["plain"])) > 0:
+            winner = "plain"
+            jobs["support"].cancel()
+            # orca must be gone before its output directory is removed
+            if jobs["support"].started:
+                await jobs["support"].stopped.wait()
         else:
-            subprocess.run("./OrcaSlicer.AppImage --load-settings \"orca-input/standard.json;orca-input/a1.json\" --load-filaments \"orca-input/pla.json\" --arrange 1 --orient 1 --arrange 1 --slice 0 --outputdir " + str(out) + " " + " ".join(paths), shell=True, cwd=os.getcwd())
+            await jobs["support"]
+            if len(gcode_files(variants["support"])) > 0:
+                winner = "support"
+        if winner is not None:
+            for name in os.listdir(variants[winner]):
+                os.replace(os.path.join(variants[winner], name), os.path.join(str(out), name))
+        for variant_out in variants.values():
+            shutil.rmtree(variant_out, ignore_errors=True)
+        print("speculative slice", out, winner)
+        return winner
+    async def worker(self):
+        queue = self.queue # stop() drops it before the cancelled worker gets here
+        while True:
+            jobs = await queue.get()
+            try:
+                await asyncio.gather(*[self.start(job) for job in jobs])
+            finally:
+                queue.task_done()
+    async def start(self, job):
+        try:
+            if not job.cancelled:
+                job.started = True
+                await self.run(job)
+        except Exception:
+            print(traceback.format_exc())
+        finally:
+            job.stopped.set()
+            if not job.future.done():
+                job.future.set_result(None)
+    async def run(self, job):
+        job.process = await asyncio.create_subprocess_exec(*self.command(job.paths, job.out, job.support), cwd=os.getcwd())
+        if job.cancelled:
+            # cancelled while the process was starting, cancel() had nothing to kill
+            job.process.kill()
+            await job.process.wait()
+            return
+        try:
+            await asyncio.wait_for(job.process.wait(), job.timeout)
+        except asyncio.CancelledError:
+            job.process.kill()
+            await job.process.wait()
+            raise
+        except asyncio.TimeoutError:
+            print("slice timed out", job.out)
+            job.timed_out = True
+            job.process.kill()
+            await job.process.wait()
+            return
+        if not job.future.done():
+            job.future.set_result(job.process.returncode)
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.queue = None
+
+def gcode_files(path):
+    """
+    non-empty .gcode files orca left in a directory
+    """
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, x) for x in sorted(os.listdir(path)) if x.endswith(".gcode") and os.path.getsize(os.path.join(path, x)) > 0]
@@ -0,0 +1,197 @@
+import os
+import re
+import json
+from visual.stream import mapped, lines
+from visual.report import GENERIC_DENSITY
+
+# orca/bambu write a header block at the top and the statistics + config blocks at the
+# bottom. only these windows are read unless the markers can't be found
+HEAD_SIZE = 64 * 1024
+TAIL_SIZE = 2 * 1024 * 1024
+STATS_SIZE = 8 * 1024
+
+HEADER_START = b"; HEADER_BLOCK_START"
+HEADER_END = b"; HEADER_BLOCK_END"
+CONFIG_START = b"; CONFIG_BLOCK_START"
+CONFIG_END = b"; CONFIG_BLOCK_END"
+
+TIME_MODE = re.compile(r"^estimated (first layer )?printing time \((\w+) mode\)$")
+DURATION = re.compile(r"(\d+)\s*([dhms])")
+
+class PlateStats:
+    """
+    what orca tells us about a sliced plate. lists are per extruder (ams slot)
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.plate = None
+        self.layers = None
+        self.filament_mm = []
+        self.filament_cm3 = []
+        self.filament_g = []
+        self.times = {} # mode -> seconds ("normal", "silent", "total", "model")
+        self.time_text = {} # mode -> text as orca wrote it
+        self.first_layer_times = {}
+        self.header = {}
+        self.config = {}
+        self.full_scan = False
+    @property
+    def total_cm3(self):
+        return sum(self.filament_cm3)
+    @property
+    def total_g(self):
+        return sum(self.filament_g)
+    def densities(self, profile_densities=()):
+        """
+        g/cm3 per extruder. what the slicer used (config block) wins, then the
+        loaded filament profiles, then generic PLA
+        """
+        sliced = parse_list(self.config.get("filament_density", self.header.get("filament_density", "")))
+        densities = []
+        for slot in range(len(self.filament_cm3)):
+            if slot < len(sliced) and sliced[slot] > 0:
+                densities.append(sliced[slot])
+            elif slot < len(profile_densities):
+                densities.append(profile_densities[slot])
+            elif len(profile_densities) > 0:
+                densities.append(profile_densities[-1])
+            else:
+                densities.append(GENERIC_DENSITY)
+        return densities
+    def slots(self, profile_densities=()):
+        """
+        [(ams slot, cm3, grams)] for every slot that is used, slots count from 1
+        """
+        densities = self.densities(profile_densities)
+        return [(slot + 1, cm3, cm3 * density) for slot, (cm3, density) in enumerate(zip(self.filament_cm3, densities)) if cm3 > 0]
+    def grams(self, profile_densities=()):
+        return sum(x[2] for x in self.slots(profile_densities))
+    def time(self):
+        # the header's total is what orca shows in the gui
+        for mode in ("total", "normal"):
+            if mode in self.time_text:
+                return self.time_text[mode]
+        return None
+    def add(self, key, value):
+        """
+        stores one "key = value" / "key: value" statistics line
+        """
+        if key == "filament used [mm]" or key == "total filament length [mm]":
+            self.filament_mm = parse_list(value)
+        elif key == "filament used [cm3]" or key == "total filament volume [cm^3]":
+            self.filament_cm3 = parse_list(value)
+        elif key == "filament used [g]" or key == "total filament weight [g]":
+            self.filament_g = parse_list(value)
+        elif key == "total layers count" or key == "total layer number":
+            self.layers = int(value)
+        elif key == "plate_index":
+            self.plate = int(value)
+        elif key == "total estimated time" or key == "model printing time":
+            mode = key.split(" ")[0]
+            self.time_text[mode] = value
+            self.times[mode] = parse_duration(value)
+        else:
+            match = TIME_MODE.match(key)
+            if match is None:
+                return False
+            times = self.first_layer_times if match.group(1) else self.times
+            times[match.group(2)] = parse_duration(value)
+            if not match.group(1):
+                self.time_text[match.group(2)] = value
+        return True
+    def __repr__(self):
+        return f"PlateStats(plate={self.plate}, layers={self.layers}, cm3={self.filament_cm3}, time={self.time()})"
+
+def load_density(path):
+    """
+    density of an orca filament profile, None if it doesn't set one
+    """
+    with open(path, "r") as profile_file:
+        profile = json.load(profile_file)
+    density = profile.get("filament_density")
+    if isinstance(density, list):
+        density = density[0] if len(density) > 0 else None
+    try:
+        density = float(density)
+    except (TypeError, ValueError):
+        return None
+    return density if density > 0 else None
+
+def parse_list(value):
+    return [float(x) for x in value.replace(";", ",").split(",") if x.strip() != ""]
+
+def parse_duration(text):
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    return sum(int(n) * units[u] for n, u in DURATION.findall(text))
+
+def split_line(line):
+    """
+    "; key = value" or "; key: value" -> (key, value), None for anything else
+    """
+    line = line.strip()
+    if not line.startswith(";"):
+        return None
+    line = line[1:].strip()
+    for sep in (" = ", ": "):
+        if sep in line:
+            key, value = line.split(sep, 1)
+            return key.strip(), value.strip()
+    return None
+
+def read_stats(path):
+    """
+    reads the header and footer blocks of an orca gcode file, only falling back to
+    scanning every line when the block markers are missing
+    """
+    stats = PlateStats(path)
+    with mapped(path, sequential=False) as mm:
+        if mm is None:
+            return stats
+        size = len(mm)
+        head_end = mm.find(HEADER_END, 0, HEAD_SIZE)
+        if head_end != -1:
+            head_start = mm.find(HEADER_START, 0, head_end)
+            for line in mm[max(head_start, 0):head_end].decode(errors="replace").splitlines():
+                parse_header_line(stats, line)
+        config_start = mm.rfind(CONFIG_START, max(size - TAIL_SIZE, 0))
+        if config_start != -1:
+            # the statistics sit right above the config block
+            for line in mm[max(config_start - STATS_SIZE, 0):config_start].decode(errors="replace").splitlines():
+                split = split_line(line)
+                if split is not None:
+                    stats.add(*split)
+            config_end = mm.find(CONFIG_END, config_start)
+            config_end = size if config_end == -1 else config_end
+            for line in mm[config_start + len(CONFIG_START):config_end].decode(errors="replace").splitlines():
+                split = split_line(line)
+                if split is not None:
+                    stats.config[split[0]] = split[1]
+    if stats.filament_cm3 == [] or stats.time() is None:
+        full_scan(stats, path)
+    if stats.plate is None:
+        match = re.search(r"plate_(\d+)", os.path.basename(path))
+        if match:
+            stats.plate = int(match.group(1))
+    return stats
+
+def parse_header_line(stats, line):
+    # "; model printing time: 1h 2m 3s; total estimated time: 1h 10m 3s" has two pairs
+    for part in line.split(";"):
+        split = split_line(";" + part)
+        if split is not None:
+            stats.header[split[0]] = split[1]
+            stats.add(*split)
+
+def full_scan(stats, path):
+    stats.full_scan = True
+    print("no stats blocks found, scanning", path)
+    for line in lines(path):
+        if not line.startswith(b";"):
+            continue
+        line = line.decode(errors="replace")
+        if "total estimated time" in line:
+            parse_header_line(stats, line)
+            continue
+        split = split_line(line)
+        if split is not None:
+            stats.add(*split)
@@ -1,8 +1,22 @@
 from .read import read
-from matplotlib import animation
+from .gsettings import gsettings
+from .report import feature_report, GENERIC_DENSITY
 
-def visualize(path, save_path):
-    gcode = read(path, no_travel=True)
-    writer = animation.FFMpegWriter(fps=10, extra_args=["-crf", "0"], bitrate=1000000)
-    # matplotlib is silly and interval=0 is ABSOLUTELY UNACCEPTABLE
-    gcode.animated('b', save_file=save_path, show=False, interval=0.000000000000000001, writer=writer, frames=100)
+def visualize(path, save_path, dpi=150, figsize=(6.4, 4.8), frames=100, fps=10, graphics='matplotlib', by='extrusion', layers_per_frame=None, max_moves=None, lod=0.5, layers=None, report=False, diameter=1.75, density=GENERIC_DENSITY):
+    gcode = read(path, mode='analysis', settings=gsettings(graphics=graphics))
+    # with report the feature breakdown of the same read is returned, see report(). it
+    # needs the travel moves, which are dropped after
+    breakdown = feature_report(gcode, diameter=diameter, density=density) if report else None
+    gcode.select(gcode.path.printed)
+    # only the new part of the path is drawn each frame, see gcode.video. 'raster'
+    # graphics orbit the camera with the numpy rasterizer instead. frames are cut by
+    # extruded length unless told otherwise, see frames.py. moves that wouldn't show at
+    # this size are dropped first, see lod.py
+    gcode.video(save_path, frames=frames, fps=fps, dpi=dpi, figsize=figsize, progress=False,
+                by=by, layers_per_frame=layers_per_frame, max_moves=max_moves, lod=lod, layers=layers)
+    return breakdown
+
+def report(path, diameter=1.75, density=GENERIC_DENSITY):
+    # filament, weight and time per feature (;TYPE: or ; FEATURE: comments) and per layer, see report.py.
+    # travel is kept so its time counts towards the feature it happens in
+    return feature_report(read(path, mode='analysis'), diameter=diameter, density=density)
@@ -0,0 +1,225 @@
+'''
+Rough benchmarks for the preview pipeline. Run with
+
+    python -m visual.bench plate_1.gcode
+
+or with --check for only the read mode, lod and print time checks, which fail with
+an AssertionError when they're off
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import os
+import sys
+import tempfile
+import numpy as np
+from time import perf_counter
+from .read import read
+from .gsettings import gsettings
+
+
+# times both read modes on the same file and prints lines per second
+def bench_read(path, repeat=3):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to read
+    > REPEAT: the number of runs per mode, the best one is reported
+    '''
+
+    with open(path, 'rb') as f:
+        lines = f.read().count(b'\n')
+
+    results = {}
+    for mode in ('full', 'analysis'):
+        best = None
+        for i in range(repeat):
+            start = perf_counter()
+            code = read(path, mode=mode)
+            took = perf_counter() - start
+            best = took if best is None else min(best, took)
+        results[mode] = best
+        print('{:>8}: {:8.3f}s {:12,.0f} lines/s ({} moves)'.format(mode, best, lines / best, len(code.path)))
+
+    print('speedup: {:.1f}x'.format(results['full'] / results['analysis']))
+    return results
+
+
+# reads a file in both modes and checks they give the same toolpath, layers and
+# features. the file is checked again with CRLF line endings
+def bench_modes(path, crlf=True):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to read
+    > CRLF: also check a copy with windows line endings
+    '''
+
+    paths = [path]
+    if crlf:
+        with open(path, 'rb') as f:
+            text = f.read().replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+        handle, copy = tempfile.mkstemp(suffix='.gcode')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(text)
+        paths.append(copy)
+
+    try:
+        for name, file in zip(('lf', 'crlf'), paths):
+            full = read(file, mode='full')
+            analysis = read(file, mode='analysis')
+            a, b = full.path, analysis.path
+            same = {'rows':len(a) == len(b)}
+            if same['rows']:
+                same.update({'xyz':np.allclose(a.xyz, b.xyz), 'e':np.allclose(a.e, b.e, atol=1e-5),
+                             'motion':np.array_equal(a.motion, b.motion),
+                             'layers':np.array_equal(full.layers.start, analysis.layers.start),
+                             'features':full.feature_marks == analysis.feature_marks})
+            print('{:>8}: {} rows full, {} analysis, {}'.format(name, len(a), len(b),
+                  ', '.join(k for k, v in same.items() if not v) or 'same'))
+            assert all(same.values()), 'read modes differ on {} ({})'.format(name, ', '.join(k for k, v in same.items() if not v))
+    finally:
+        for copy in paths[1:]:
+            os.remove(copy)
+    return
+
+
+# renders a preview without encoding it and prints frames per second. the spinning
+# camera redraws everything each frame, the fixed one only draws what's new, and
+# raster is the numpy rasterizer (orbiting)
+def bench_render(path, frames=100, dpi=150):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to render
+    > FRAMES: the number of frames in the preview
+    > DPI: the resolution, at the default 6.4x4.8in figure size
+    '''
+
+    code = read(path, no_travel=True, mode='analysis')
+
+    results = {}
+    for spin in (True, False):
+        start = perf_counter()
+        rendered = code.video(None, frames=frames, dpi=dpi, spin=spin, progress=False)
+        took = perf_counter() - start
+        results['spin' if spin else 'fixed'] = rendered / took
+        print('{:>8}: {:8.3f}s {:8.1f} frames/s'.format('spin' if spin else 'fixed', took, rendered / took))
+
+    code.settings = gsettings(graphics='raster')
+    start = perf_counter()
+    rendered = code.video(None, frames=frames, dpi=dpi, progress=False)
+    took = perf_counter() - start
+    results['raster'] = rendered / took
+    print('{:>8}: {:8.3f}s {:8.1f} frames/s'.format('raster', took, rendered / took))
+
+    print('speedup: {:.1f}x fixed, {:.1f}x raster (vs spin)'.format(results['fixed'] / results['spin'], results['raster'] / results['spin']))
+    return results
+
+
+# renders a raster preview with and without lod and checks every frame draws the same
+# pixels. each frame is scored with the intersection over union of the pixels that
+# aren't background, where a pixel the other frame draws right next to counts as shared
+# so a line moved by less than a pixel doesn't count as different. the worst frame has
+# to pass, the last one alone is mostly covered on a dense plate and hides a lot
+def bench_lod(path, frames=100, dpi=150, quality=0.5, threshold=0.98, background=(255, 255, 255)):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to render
+    > FRAMES: the number of frames in the preview
+    > DPI: the resolution, at the default 6.4x4.8in figure size
+    > QUALITY: the lod tolerance in pixels
+    > THRESHOLD: the lowest score of any frame that passes
+    > BACKGROUND: the color of the empty pixels
+    '''
+
+    code = read(path, no_travel=True, mode='analysis', settings=gsettings(graphics='raster'))
+
+    drawn = []
+    scores = []
+    def keep(frame):
+        drawn.append(np.any(frame != background, axis=2))
+
+    def compare(frame):
+        full = drawn[len(scores)]
+        lod = np.any(frame != background, axis=2)
+        union = full | lod
+        shared = (full & _grow(lod, 1)) | (lod & _grow(full, 1))
+        scores.append(shared.sum() / union.sum() if union.any() else 1.0)
+
+    took = {}
+    for name, lod, on_frame in (('full', None, keep), ('lod', quality, compare)):
+        start = perf_counter()
+        code.video(None, frames=frames, dpi=dpi, spin=False, progress=False, lod=lod, on_frame=on_frame)
+        took[name] = perf_counter() - start
+        print('{:>8}: {:8.3f}s'.format(name, took[name]))
+
+    assert len(scores) == len(drawn), 'lod rendered {} frames instead of {}'.format(len(scores), len(drawn))
+    worst = min(scores) if scores else 1.0
+    print('iou: {:.4f} worst frame, {:.4f} last, speedup: {:.1f}x'.format(worst, scores[-1] if scores else 1.0,
+                                                                       took['full'] / took['lod']))
+    assert worst >= threshold, 'lod changed the picture, iou {:.4f} below {}'.format(worst, threshold)
+    return worst
+
+
+# MASK with every set pixel grown by R pixels in each direction
+def _grow(mask, r):
+    padded = np.pad(mask, r)
+    h, w = mask.shape
+    grown = np.zeros_like(mask)
+    for i in range(2 * r + 1):
+        for j in range(2 * r + 1):
+            grown |= padded[i:i + h, j:j + w]
+    return grown
+
+
+# times the kinematic estimate and checks it against what Orca wrote in the file. the
+# model time is the one compared, neither counts the heating and homing of the start
+# gcode the same way the total does
+def bench_time(path, profile=None, tolerance=0.1, process=None):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file, sliced by Orca for the printer of PROFILE
+    > PROFILE: the printer profile, timing.PROFILE if not given
+    > TOLERANCE: how far off Orca's estimate may be, as a fraction, before it fails
+    > PROCESS: the process profile, timing.PROCESS if not given
+    '''
+
+    # stats.py lives next to the visual package, run from the repo root
+    from stats import read_stats
+    from .timing import PROFILE, PROCESS
+
+    orca = read_stats(path).times
+    expected = orca.get('model') or orca.get('total')
+    assert expected, 'no Orca time estimate in {}'.format(path)
+
+    code = read(path, mode='analysis')
+    start = perf_counter()
+    times, layers = code.estimate_time(profile or PROFILE, process=process or PROCESS)
+    took = perf_counter() - start
+
+    estimate = times.sum()
+    error = estimate / expected - 1
+    print('{:>8}: {:8.3f}s for {} moves'.format('estimate', took, len(times)))
+    print('kinematic {:.0f}s, feedrate only {:.0f}s'.format(estimate, code.path.t[-1] * 60 if len(code.path) else 0))
+    for mode in ('total', 'model', 'normal'):
+        if orca.get(mode):
+            print('orca {} {}s, off by {:+.1%}'.format(mode, orca[mode], estimate / orca[mode] - 1))
+    assert abs(error) <= tolerance, 'time estimate off by {:+.1%}, more than {:.0%}'.format(error, tolerance)
+    return error
+
+
+if __name__ == '__main__':
+    # --check only runs the ones that pass or fail, an AssertionError exits non zero
+    check = '--check' in sys.argv[1:]
+    for path in [arg for arg in sys.argv[1:] if arg != '--check']:
+        print(path)
+        if not check:
+            bench_read(path)
+            bench_render(path)
+        bench_modes(path)
+        bench_lod(path)
+        bench_time(path)
@@ -0,0 +1,160 @@
+'''
+Frame planning for preview videos. Splitting the path into frames with an equal
+number of moves spends most frames on dense infill and skips through long travels,
+so frames near the top of a tall print barely change. These plans cut frames by
+extruded length or by layer instead, with a cap on how many moves one frame can add.
+
+A plan is an increasing array of move indices, one per frame: frame n shows the path
+up to cuts[n].
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import math
+import numpy as np
+
+
+# extrusion shorter than this doesn't count as printing (wipes, tiny primes)
+MIN_EXTRUDE = 1e-5
+
+
+# makes a frame plan for a toolpath
+def plan_frames(path, frames=100, by='extrusion', layers_per_frame=None, max_moves=None,
+                starts=None):
+    '''
+    Parameters:
+
+    > PATH: the toolpath to plan for
+    > FRAMES: the number of frames to aim for. with layers_per_frame in 'layer' mode
+        the video is as long as it needs to be instead
+    > BY: 'moves' gives every frame the same number of moves (the old behaviour),
+        'extrusion' the same extruded length and 'layer' whole layers
+    > LAYERS_PER_FRAME: 'layer' mode only, the number of layers each frame adds
+    > MAX_MOVES: frames adding more moves than this are split, which makes the video
+        longer but keeps the work per frame bounded
+    > STARTS: 'layer' mode only, the row each layer starts at from the layer index
+        (layers.py). rows outside the path are ignored. found from z when not given
+    '''
+
+    n = len(path)
+    if n == 0:
+        return np.zeros(1, dtype=np.int64)
+    frames = max(int(frames), 1)
+
+    if by == 'moves':
+        cuts = by_moves(n, frames)
+    elif by == 'extrusion':
+        cuts = by_extrusion(path.e, frames)
+    elif by == 'layer':
+        if starts is None:
+            starts = layer_starts(path.z, path.e)
+        cuts = by_layer(starts, n, frames, layers_per_frame)
+    else:
+        raise ValueError('Unknown frame plan {}'.format(by))
+
+    # the last frame always shows everything
+    cuts = np.unique(np.append(cuts[(cuts > 0) & (cuts < n)], n))
+
+    if max_moves:
+        cuts = cap_moves(cuts, int(max_moves))
+
+    return cuts
+
+
+# every frame adds the same number of moves
+def by_moves(n, frames):
+    '''
+    Parameters:
+
+    > N: the number of moves
+    > FRAMES: the number of frames
+    '''
+
+    return np.linspace(0, n, frames + 1)[1:].astype(np.int64)
+
+
+# every frame adds about the same length of extrusion
+def by_extrusion(e, frames):
+    '''
+    Parameters:
+
+    > E: the extrusion of each move
+    > FRAMES: the number of frames
+    '''
+
+    printed = np.cumsum(np.where(e > MIN_EXTRUDE, e, 0))
+    if len(printed) == 0 or printed[-1] <= 0:
+        # nothing extrudes, travel only paths still get frames
+        return by_moves(len(e), frames)
+
+    targets = printed[-1] * np.arange(1, frames + 1) / frames
+    # the move that reaches each target is the last one in its frame, and the last
+    # frame takes whatever travel comes after the final extrusion
+    cuts = np.searchsorted(printed, targets) + 1
+    cuts[-1] = len(e)
+    return cuts
+
+
+# the move indices where each new layer starts printing
+def layer_starts(z, e):
+    '''
+    Parameters:
+
+    > Z: the z of each move
+    > E: the extrusion of each move
+    '''
+
+    # only the height of printing moves counts, so z hops and travels to the next
+    # layer don't start a layer early
+    printing = np.flatnonzero(e > MIN_EXTRUDE)
+    if len(printing) == 0:
+        return np.zeros(0, dtype=np.int64)
+    height = z[printing]
+    top = np.maximum.accumulate(height)
+    new = np.flatnonzero(height[1:] > top[:-1] + MIN_EXTRUDE) + 1
+    return printing[new]
+
+
+# every frame adds whole layers
+def by_layer(starts, n, frames, layers_per_frame=None):
+    '''
+    Parameters:
+
+    > STARTS: the row each layer starts at
+    > N: the number of moves
+    > FRAMES: the number of frames to aim for when layers_per_frame isn't given
+    > LAYERS_PER_FRAME: the number of layers each frame adds
+    '''
+
+    # the first layer takes everything before it, so only starts inside the path cut
+    starts = np.unique(np.asarray(starts, dtype=np.int64))
+    starts = starts[(starts > 0) & (starts < n)]
+    layers = len(starts) + 1
+    if layers_per_frame is None:
+        layers_per_frame = math.ceil(layers / frames)
+    layers_per_frame = max(int(layers_per_frame), 1)
+
+    # a frame ends where the layer after its last one starts
+    return starts[layers_per_frame - 1::layers_per_frame]
+
+
+# splits frames that add more than max_moves moves
+def cap_moves(cuts, max_moves):
+    '''
+    Parameters:
+
+    > CUTS: a frame plan
+    > MAX_MOVES: the most moves one frame may add
+    '''
+
+    starts = np.concatenate([[0], cuts[:-1]])
+    pieces = np.maximum(np.ceil((cuts - starts) / max_moves), 1).astype(np.int64)
+    if (pieces == 1).all():
+        return cuts
+
+    # evenly spaced cuts inside each frame that is too big
+    frame = np.repeat(np.arange(len(cuts)), pieces)
+    step = np.arange(len(frame)) - np.repeat(np.cumsum(pieces) - pieces, pieces) + 1
+    split = starts[frame] + (cuts[frame] - starts[frame]) * step // pieces[frame]
+    return split.astype(np.int64)
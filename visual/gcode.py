@@ -6,9 +6,15 @@ Modified by Edna
 # imports -----------------------------------------------------------------------
 from .gline import gline
 from .gsettings import gsettings
+from .toolpath import toolpath, classify, move_accel, MOVE, HOME, DWELL, TRAVEL
 from .helper import *
 from .visual import *
-from numpy import array, zeros, any, all, shape
+from .raster import raster_view
+from .frames import plan_frames
+from .lod import simplify, QUALITY, MIN_MOVES
+from .layers import index_layers
+from .timing import machine_limits, move_times, layer_times, PROFILE, PROCESS
+from numpy import array, zeros, any, all, shape, flatnonzero, concatenate, searchsorted
 from numpy.linalg import norm
 
 
@@ -43,8 +49,20 @@ class gcode():
         # number of lines written
         self.count = 0
 
-        # creating motion history list
-        self.history = []
+        # creating motion history. columnar arrays of position, extrusion, feedrate,
+        # time and move type. history and t are views into it
+        self.path = toolpath()
+
+        # (row, z, height) of every layer change comment read, and the layer index
+        # built from them. see layers.py
+        self.layer_marks = []
+        self._layers = None
+
+        # whether every move read is still in the toolpath. select clears it
+        self.complete = True
+
+        # (row, name) of every feature comment read, see report.py
+        self.feature_marks = []
 
         # records the current and previous position
         self.current_pos = zeros(3) # numpy
@@ -59,12 +77,19 @@ class gcode():
         # sets default for
         self.unit_sys = 'mm'
 
+        # extruder mode (M82 absolute, M83 relative) and the E position the absolute
+        # values are taken from. the toolpath always records how much each move extruded
+        self.rel_e = False
+        self.e_pos = 0
+
+        # M204 printing, travel and retract accelerations and the M205 xy jerk, 0 until
+        # they are set. recorded with every move for the time estimate
+        self.accel = [0, 0, 0]
+        self.jerk = 0
+
         # internal recording of the total print time
         self.print_time = 0 # units of minutes
 
-        # internal recording of time at each motion
-        self.t = []
-
         # recording the print speed
         self.print_speed = 0
 
@@ -74,7 +99,8 @@ class gcode():
                               'G20':self.use_in,'G21':self.use_mm,'G28':self.go_home,
                               'G90':self.abs_move,'G91':self.rel_move,'G92':self.set_pos,
                               'M30':self.manual_mask_off,
-                              'M82':self.rel_extrude,'M83':self.abs_extrude,'M84':self.stop_idle,
+                              'M82':self.abs_extrude,'M83':self.rel_extrude,'M84':self.stop_idle,
+                              'M204':self.set_accel,'M205':self.set_jerk,
                               'M103':self.stop_extrude,'M104':self.extruders_off,
                               'M106':self.fan,
                               'M107':self.fan_off,'M190':self.wait_for_temp,'M721':self.unprime,
@@ -82,6 +108,9 @@ class gcode():
                               'M756':self.first_layer_thick,'M790':self.new_layer,
                               ';':self.comment,'\n':self.blank}
 
+        # the same commands zero padded, as some firmwares and CAM tools write them
+        self.gcode_methods.update({'G00':self.rapid_move,'G01':self.move,'G04':self.dwell})
+
         # end of init
         return
 
@@ -172,8 +201,10 @@ class gcode():
             # Creating line of gcode
             line = gline('G1', com)
 
-            # writing only speed and extrude
-            self._move_format(line, speed=speed, extrude=extrude)
+            # writing only speed and extrude. with an E it is still a move in place,
+            # so what it extrudes or retracts is recorded
+            moved = pos if extrude or extrude == 0 else None
+            self._move_format(line, moved, speed=speed, extrude=extrude)
 
         else:
             # array case
@@ -368,7 +399,7 @@ class gcode():
             line.append('S{}'.format(sec))
 
             # writing to memory with time in units of minutes
-            self.write(line, self.current_pos, time/60)
+            self.write(line, self.current_pos, time/60, kind=DWELL)
             return
 
         elif milisec:
@@ -376,7 +407,7 @@ class gcode():
             line.append('P{}'.format(milisec))
 
             # writing to memory with time in units of minutes
-            self.write(line, self.current_pos, time/(60*1000))
+            self.write(line, self.current_pos, time/(60*1000), kind=DWELL)
 
             return
         else:
@@ -501,7 +532,7 @@ class gcode():
 
             # recording line to mem and indicating that this is a move to write
             # the position of zeros forces the printer to return to the zero
-            self.write(line, zeros(3)) # zeros is numpy
+            self.write(line, zeros(3), kind=HOME) # zeros is numpy
             # end of go home
         return
 
@@ -560,6 +591,8 @@ class gcode():
         # writes the extrusion command to this line
         if extrude or extrude == 0:
             line.append('E' + self.settings['extrude'].format(extrude))
+            # moves after this count from the new E position
+            self.e_pos = extrude
 
         # writing to memory
         self.write(line)
@@ -581,7 +614,8 @@ class gcode():
     def abs_extrude(self, com='Absolute Extrusion Mode'):
 
         # create gcode command
-        line = gline('M83', com)
+        line = gline('M82', com)
+        self.rel_e = False
 
         # should I record the volume used?
 
@@ -593,7 +627,8 @@ class gcode():
     def rel_extrude(self, com='Relative Extrusion Mode'):
 
         # create gcode command
-        line = gline('M82', com)
+        line = gline('M83', com)
+        self.rel_e = True
 
         # should I record the volume used?
 
@@ -601,6 +636,59 @@ class gcode():
         self.write(line)
         return
 
+    # Method to set the acceleration of the moves after it
+    # http://reprap.org/wiki/G-code#M204:_Set_default_acceleration
+    def set_accel(self, s=None, p=None, t=None, r=None, com=None):
+        '''
+        Parameters:
+
+        > S: the printing and travel acceleration in units/s^2
+        > P: the printing acceleration
+        > T: the travel acceleration
+        > R: the retract acceleration
+        '''
+
+        line = gline('M204', com)
+        for letter, value in (('S', s), ('P', p), ('T', t), ('R', r)):
+            if value or value == 0:
+                line.append(letter + str(value))
+
+        if s or s == 0:
+            self.accel[0] = self.accel[1] = float(s)
+        if p or p == 0:
+            self.accel[0] = float(p)
+        if t or t == 0:
+            self.accel[1] = float(t)
+        if r or r == 0:
+            self.accel[2] = float(r)
+
+        self.write(line)
+        return
+
+
+    # Method to set the jerk of the moves after it
+    # http://reprap.org/wiki/G-code#M205:_Advanced_settings
+    def set_jerk(self, x=None, y=None, com=None):
+        '''
+        Parameters:
+
+        > X, Y: the jerk of each axis in units/s. the smaller is used for both
+        '''
+
+        line = gline('M205', com)
+        given = []
+        for letter, value in (('X', x), ('Y', y)):
+            if value or value == 0:
+                line.append(letter + str(value))
+                given.append(float(value))
+
+        if given:
+            self.jerk = min(given)
+
+        self.write(line)
+        return
+
+
     # Method to stop idle in the printer
     def stop_idle(self, com='Stop idle hold'):
         '''
@@ -781,6 +869,21 @@ class gcode():
         '''
         line = gline(comment=com)
 
+        # Orca marks every layer, the z and thickness follow on their own lines. the
+        # Bambu flavour spells them CHANGE_LAYER, Z_HEIGHT: and LAYER_HEIGHT:
+        if com.startswith('LAYER_CHANGE') or com.startswith('CHANGE_LAYER'):
+            self.layer_marks.append([len(self.path), float('nan'), float('nan')])
+        elif com.startswith('TYPE:') or com.startswith('FEATURE:'):
+            self.feature_marks.append((len(self.path), com.split(':', 1)[1].strip()))
+        elif self.layer_marks and self.layer_marks[-1][0] == len(self.path):
+            try:
+                if com.startswith('Z:') or com.startswith('Z_HEIGHT:'):
+                    self.layer_marks[-1][1] = float(com.split(':', 1)[1])
+                elif com.startswith('HEIGHT:') or com.startswith('LAYER_HEIGHT:'):
+                    self.layer_marks[-1][2] = float(com.split(':', 1)[1])
+            except ValueError:
+                pass
+
         # writing to memory
         self.write(line)
         return
@@ -861,7 +964,7 @@ class gcode():
 
 
     ## IMPORTANT function here. write writes a line to memory as well as parses
-    def write(self, line, move=None, time=None):
+    def write(self, line, move=None, time=None, extrude=None, kind=MOVE):
 
         '''
         Parameters:
@@ -869,6 +972,8 @@ class gcode():
         > LINE:
         > MOVE:
         > TIME:
+        > EXTRUDE: the E value of the motion, recorded alongside the position
+        > KIND: the move type code recorded in the toolpath (see toolpath.py)
         '''
 
         # increasing counter
@@ -883,7 +988,7 @@ class gcode():
             # appending the line of GCODE to the vector of lines
             if any(move) or any(move == 0): # any is overriden by numpy import
                 # records motion, time to print, and position
-                self._pos_update(move, time)
+                self._pos_update(move, time, extrude, kind)
 
 
             # records GCODE
@@ -1027,12 +1132,10 @@ class gcode():
         Defined here: ax_label, ax_lim, fig_title, loop
         '''
 
-        # make a numpy array for indexing, vectorized operations, and method access
-        # getting motion history
-        # list comprehension to get the coordinates from self.history
-        X = array([i[0] for i in self.history]) # numpy
-        Y = array([i[1] for i in self.history]) # numpy
-        Z = array([i[2] for i in self.history]) # numpy
+        # getting motion history. these are views into the toolpath, no copies
+        X = self.path.x
+        Y = self.path.y
+        Z = self.path.z
 
         # defining the update function to needed by the plotting function
         def update(s, i):
@@ -1075,6 +1178,104 @@ class gcode():
         return
 
 
+    # renders the print path growing into a video, drawing only the new part of the path
+    # each frame. much faster than animated for previews. with the 'raster' graphics
+    # setting the numpy rasterizer is used instead of matplotlib
+    def video(self, save_file=None, frames=100, fig_title='Print Path', by='extrusion',
+              layers_per_frame=None, max_moves=None, lod=QUALITY, layers=None, **kwargs):
+
+        '''
+        Parameters:
+
+        > SAVE_FILE: the video file, see blit_view in visual.py
+        > FRAMES: the number of frames in the video, about. see frames.py
+        > FIG_TITLE: only drawn by matplotlib
+        > BY: how the path is cut into frames, 'moves', 'extrusion' or 'layer'
+        > LAYERS_PER_FRAME: in 'layer' mode, gives a video as long as it needs to be
+            with this many layers per frame
+        > MAX_MOVES: splits frames that would add more moves than this
+        > LOD: drops moves that would land within this many pixels of the simplified
+            path, see lod.py. None or 0 draws every move, as do paths shorter than
+            MIN_MOVES. the matplotlib renderer gains from it, raster samples by length
+            and hardly does
+        > LAYERS: (first, last) renders only those layers, both included. see
+            layers.py
+        * Notes: only printing moves are drawn, see toolpath.drawn
+        > KWARGS: passed to blit_view or raster_view (fps, dpi, figsize, spin, ...)
+        '''
+
+        # getting motion history. views into the toolpath, or a copy of the chosen layers
+        if layers is None:
+            path = self.path
+            # whatever comes before the first layer (start gcode) shows with it
+            starts = self.layers.start[1:]
+        else:
+            rows = self.layers.rows(*layers)
+            path = self.path.select(rows)
+            starts = self.layers.start - rows.start
+        X = path.x
+        Y = path.y
+        Z = path.z
+
+        # where each frame ends
+        cuts = plan_frames(path, frames, by=by, layers_per_frame=layers_per_frame,
+                           max_moves=max_moves, starts=starts)
+
+        # only segments ending on a printing move are drawn. travel only paths are
+        # drawn whole so they still show something
+        drawn = path.drawn
+        if not drawn.any():
+            drawn = None
+
+        # simplifying for the image size, frames and layers still start where they did.
+        # the ends of segments that aren't drawn are kept so no print gets merged
+        # into a jump
+        order = None
+        if lod and len(X) >= MIN_MOVES:
+            dpi = kwargs.get('dpi', 150)
+            figsize = kwargs.get('figsize', (6.4, 4.8))
+            breaks = starts
+            if drawn is not None:
+                jumps = flatnonzero(~drawn)
+                breaks = concatenate([breaks, jumps, jumps - 1])
+            order, cuts = simplify(X, Y, Z, cuts, figsize[0]*dpi, figsize[1]*dpi,
+                                   quality=lod, breaks=breaks)
+            X, Y, Z = X[order], Y[order], Z[order]
+            if drawn is not None:
+                drawn = drawn[order]
+
+        if self.settings.graphics == 'raster':
+            return raster_view(X, Y, Z, save_file=save_file, cuts=cuts, order=order,
+                               drawn=drawn, **kwargs)
+
+        # defining the update function to needed by the plotting function
+        def update(s, i):
+            return X[s:i], Y[s:i], Z[s:i]
+
+        # generating labels for the axes
+        ax_labels = ['X ({})'.format(self.unit_sys),'Y ({})'.format(self.unit_sys),
+                     'Z ({})'.format(self.unit_sys)]
+
+        # Keeps aspect ratio square
+        max_range = array([X.max()-X.min(),
+                              Y.max()-Y.min(),
+                              Z.max()-Z.min()]).max() / 2.0
+
+        mean_x = X.mean()
+        mean_y = Y.mean()
+        mean_z = Z.mean()
+
+        # generating the axis limits
+        ax_lim = [mean_x - max_range, mean_x + max_range,
+                  mean_y - max_range, mean_y + max_range,
+                  mean_z - max_range, mean_z + max_range]
+
+        # calling function from visual.py
+        return blit_view(update, loop=len(X), ax_label=ax_labels, ax_lim=ax_lim,
+                         fig_title=fig_title, save_file=save_file, cuts=cuts, drawn=drawn,
+                         **kwargs)
+
+
     # method that has a slider on the bottom of the figure to animate the print path
     def slide_view(self, *args, fig_title='Printer Path', **kwargs):
         '''
@@ -1085,11 +1286,10 @@ class gcode():
 
 
 
-        # getting motion history
-        # list comprehension to get the coordingates from self.history
-        X = array([i[0] for i in self.history]) # numpy
-        Y = array([i[1] for i in self.history]) # numpy
-        Z = array([i[2] for i in self.history]) # numpy
+        # getting motion history. these are views into the toolpath, no copies
+        X = self.path.x
+        Y = self.path.y
+        Z = self.path.z
 
         # defining the update function to needed by the plotting function
         def update(i):
@@ -1200,7 +1400,7 @@ class gcode():
         # determining how to return values or to save the GCODE lines to memory
         if write:
             # writing to memory
-            self.write(line,pos)
+            self.write(line,pos,extrude=extrude)
         else:
             # returning both values
             return line, pos
@@ -1234,6 +1434,8 @@ class gcode():
 
         > TIME: if time is given, this time is added to the running total
             and to the
+
+        Returns the running print time after this motion
         '''
 
         # distance is the 2-norm distance between the two points
@@ -1255,21 +1457,20 @@ class gcode():
             if self.count == 1:
                 print('Print speed not set. Print Times are Inf')
 
-        # adds an element to a vector of time
-        self.t.append(self.print_time)
-
-        return
+        return self.print_time
 
 
 
     # method to internally handle updating the previous and current position, the
     # to the time to move, and recording the history of motion for plotting
-    def _pos_update(self, pos, time=None):
+    def _pos_update(self, pos, time=None, extrude=None, kind=MOVE):
         '''
         Parameters:
 
         > POS: the newly moved to position.  This is always recorded in absolute
             coordinates
+        > EXTRUDE: the E value of the motion
+        > KIND: the move type code, see toolpath.py
         '''
 
         # reassigning positions of the print head based on motion given by po
@@ -1285,17 +1486,39 @@ class gcode():
             # records position for relative coordinates. Position is in abs coordinates
             self.current_pos += pos
 
-        # recording motion
-        # need to pass a copy because a pointer is passed by default.
-        # this would mean that self.history would just be a list of the same pointer
-        self.history.append(self.current_pos.copy())
+        # updates the time taken to move the print head
+        print_time = self._time(time)
+
+        # how much the move extruded. like G91 for the axes, relative E is relative
+        # in either mode
+        extrude = self._extrude(extrude)
+        motion = classify([self.current_pos - self.previous_pos], [extrude])[0] if kind == MOVE else TRAVEL
 
+        # the acceleration set for this kind of move
+        accel = move_accel(motion, *self.accel)
 
-        # updates the time taken to move the print head
-        self._time(time)
+        # recording motion. the toolpath copies the values into its own buffers
+        self.path.append(self.current_pos, extrude, self.print_speed, print_time, kind, motion,
+                         accel, self.jerk)
 
         return
 
+    # the E value of a move as the filament it pushed, keeping track of the E
+    # position for absolute extrusion. called in _pos_update
+    def _extrude(self, extrude=None):
+
+        # no E word, nothing extruded
+        if not extrude and extrude != 0:
+            return 0
+
+        if self.rel_e or self.coords != 'abs':
+            self.e_pos += extrude
+            return extrude
+
+        delta = extrude - self.e_pos
+        self.e_pos = extrude
+        return delta
+
     # Method to control the fan parameters
     def _control_fan(self,line,fan_speed=None, fan_n=None, invert_sig=None, fan_freq=None,
                      set_min_speed=None, blip_time=None, select_heaters=None, restore_speed=None,
@@ -1347,6 +1570,69 @@ class gcode():
         pass
 
 
+    # motion history as an (n,3) array view, kept for code written against the list
+    @property
+    def history(self):
+        return self.path.xyz
+
+    # running print time at each motion as an array view
+    @property
+    def t(self):
+        return self.path.t
+
+    # the layer index, see layers.py. built when first asked for if reading didn't
+    @property
+    def layers(self):
+        if self._layers is None:
+            self.index_layers()
+        return self._layers
+
+
+    # (re)builds the layer index from the layer changes seen so far, or from the
+    # height of the path if there weren't any
+    def index_layers(self):
+        self._layers = index_layers(self.path, self.layer_marks)
+        return self._layers
+
+
+    # print time with acceleration and the machine limits of a printer profile, see
+    # timing.py. returns the seconds of every move and of every layer
+    def estimate_time(self, profile=PROFILE, mode=0, process=PROCESS):
+        '''
+        Parameters:
+
+        > PROFILE: the Orca printer profile with the machine limits
+        > MODE: 0 for the normal limits, 1 for silent
+        > PROCESS: the Orca process profile with the default acceleration
+        '''
+
+        # the speed at every corner depends on the moves around it, dropped travels
+        # and retracts would change all of them
+        if not self.complete:
+            raise ValueError('Print time needs every move, read without no_travel')
+
+        times = move_times(self.path, machine_limits(profile, mode, process))
+        return times, layer_times(times, self.layers)
+
+
+    # keeps only some rows of the toolpath, the layer index and marks follow
+    def select(self, keep):
+        '''
+        Parameters:
+
+        > KEEP: boolean array, one per row of the toolpath
+        '''
+
+        layers = self.layers
+        rows = flatnonzero(keep)
+        self.path = self.path.select(keep)
+        self.complete = self.complete and bool(all(keep))
+        self._layers = layers.select(keep)
+        self.layer_marks = [(int(searchsorted(rows, row)),) + tuple(rest) for row, *rest in self.layer_marks]
+        self.feature_marks = [(int(searchsorted(rows, row)), name) for row, name in self.feature_marks]
+        return
+
+
     # functions that give the printing options of the GCODE
     def __repr__(self):
         # creates a print object and returns that
@@ -12,7 +12,8 @@ class gsettings():
         self.lib = {'pos':pos_str, 'extrude':extrude_str, 'speed':speed_str}
 
         # this is the graphics backend choice to avoid specifying
-        # it everytime for different types of figures
+        # it everytime for different types of figures. 'raster' renders videos
+        # with the numpy rasterizer in raster.py instead of matplotlib
         self.graphics = graphics
 
         # end of init
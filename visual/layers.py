@@ -0,0 +1,152 @@
+'''
+Layer index over a toolpath. Layers are found while reading, from the
+;LAYER_CHANGE / ;Z: / ;HEIGHT: comments Orca writes before every layer (; CHANGE_LAYER
+/ ; Z_HEIGHT: / ; LAYER_HEIGHT: for Bambu printers), and from the
+height of the printing moves when a file has no such comments. Every layer maps to
+a range of toolpath rows, so taking a layer out of any column is a slice and not a
+search.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import numpy as np
+from .frames import layer_starts
+
+
+# layer number -> toolpath rows, z, thickness and time
+class layerindex():
+
+    def __init__(self, start, end, z, height, time):
+        '''
+        Parameters:
+
+        > START, END: the first row of each layer and the row after its last one
+        > Z: the height each layer prints at
+        > HEIGHT: the thickness of each layer
+        > TIME: the print time of each layer in minutes
+        '''
+
+        self.start = np.asarray(start, dtype=np.int64)
+        self.end = np.asarray(end, dtype=np.int64)
+        self.z = np.asarray(z, dtype=np.float64)
+        self.height = np.asarray(height, dtype=np.float64)
+        self.time = np.asarray(time, dtype=np.float64)
+
+        # end of init
+        return
+
+
+    # the toolpath rows of layers FIRST to LAST, both included, as a slice
+    def rows(self, first, last=None):
+        '''
+        Parameters:
+
+        > FIRST: the first layer, negative counts from the top
+        > LAST: the last layer, FIRST if not given
+        '''
+
+        last = first if last is None else last
+        return slice(int(self.start[first]), int(self.end[last]))
+
+
+    # the layer each row is in, -1 for rows before the first layer
+    def layer_of(self, rows):
+        '''
+        Parameters:
+
+        > ROWS: a row or an array of rows
+        '''
+
+        return np.searchsorted(self.start, rows, side='right') - 1
+
+
+    # the same layers over a toolpath that only kept the rows where KEEP is set, see
+    # toolpath.select. times are kept as they were measured on the whole path
+    def select(self, keep):
+        '''
+        Parameters:
+
+        > KEEP: boolean array, one per row of the toolpath the index was built on
+        '''
+
+        rows = np.flatnonzero(keep)
+        return layerindex(np.searchsorted(rows, self.start), np.searchsorted(rows, self.end),
+                          self.z, self.height, self.time)
+
+
+    # methods for builtin function access
+    def __getitem__(self, layer):
+        return self.rows(layer)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return 'layerindex({} layers)'.format(len(self))
+
+
+# builds the layer index of a toolpath
+def index_layers(path, marks=None):
+    '''
+    Parameters:
+
+    > PATH: the toolpath
+    > MARKS: (row, z, height) for every ;LAYER_CHANGE found while reading, where row
+        is the number of toolpath rows before it. z and height are nan when the
+        comments didn't give them. without marks layers are found from z
+    '''
+
+    n = len(path)
+    z = path.z
+    printing = path.drawn
+
+    if marks:
+        start, mark_z, mark_height = (np.array(col, dtype=np.float64) for col in zip(*marks))
+        start = start.astype(np.int64)
+
+        # every layer change moves z, so marks with no row between them are the same
+        # layer written in both spellings. the values of the last one that gave them
+        # are kept
+        last = np.append(start[1:] != start[:-1], True)
+        if not last.all():
+            group = np.cumsum(np.concatenate([[0], last[:-1]]))
+            mark_z = _merged(mark_z, group)
+            mark_height = _merged(mark_height, group)
+            start = start[last]
+    else:
+        # the first printing move starts the first layer, then every rise in height.
+        # primes and retracts at the start height don't count
+        first = np.flatnonzero(printing)[:1]
+        start = np.concatenate([first, layer_starts(z, np.where(printing, path.e, 0))]).astype(np.int64)
+        mark_z = np.full(len(start), np.nan)
+        mark_height = np.full(len(start), np.nan)
+
+    end = np.append(start[1:], n)
+
+    # the height of the printing moves where the comments didn't say. reduceat needs
+    # non empty ranges, empty layers get nan
+    top = np.full(len(start), np.nan)
+    ranged = start < end
+    if ranged.any():
+        printed_z = np.where(printing, z, -np.inf)
+        top[ranged] = np.maximum.reduceat(printed_z, start[ranged])
+        top[np.isinf(top)] = np.nan
+    layer_z = np.where(np.isnan(mark_z), top, mark_z)
+    below = np.concatenate([[0], layer_z[:-1]])
+    height = np.where(np.isnan(mark_height), layer_z - below, mark_height)
+
+    # each layer takes from the end of the row before it to the end of its last row
+    t = path.t
+    before = np.where(start > 0, t[np.maximum(start - 1, 0)], 0) if n else np.zeros(len(start))
+    after = np.where(end > 0, t[np.maximum(end - 1, 0)], 0) if n else np.zeros(len(start))
+
+    return layerindex(start, end, layer_z, height, after - before)
+
+
+# the last value that isn't nan in each group of VALUES, nan if there is none
+def _merged(values, group):
+    known = ~np.isnan(values)
+    merged = np.full(group[-1] + 1, np.nan)
+    merged[group[known]] = values[known]
+    return merged
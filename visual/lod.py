@@ -0,0 +1,151 @@
+'''
+Level of detail for rendering. Sliced plates have far more moves than a preview has
+pixels: arcs come out as hundreds of tiny chords and infill as runs of collinear
+moves. Before rendering, each stretch of the path between break points (layer starts,
+frame cuts) is simplified with Douglas-Peucker to within a fraction of a pixel, so
+the work per frame follows the image size rather than the G-code size.
+
+The Douglas-Peucker here runs on every stretch at once: each pass finds the furthest
+point of every unfinished range with numpy and splits the ranges that are still too
+far off, instead of recursing one range at a time. Ranges that get split are also
+split in the middle, which keeps a few more points than plain Douglas-Peucker but
+bounds the number of passes by log2 of the longest stretch (zigzags otherwise peel
+off one point per pass).
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import numpy as np
+
+
+# default tolerance in pixels, lower keeps more detail
+QUALITY = 0.5
+
+# paths with fewer moves than this are drawn whole. a preview of one costs about the
+# same either way, so the pass would only add to it
+MIN_MOVES = 5000
+
+# longest stretch simplified as one, so long paths without breaks still split evenly
+MAX_STRETCH = 4096
+
+
+# the size of a pixel in path units when the path is fit to a width x height image
+def pixel_size(x, y, z, width, height):
+    '''
+    Parameters:
+
+    > X, Y, Z: the path
+    > WIDTH, HEIGHT: the image size in pixels
+    '''
+
+    if len(x) == 0:
+        return 1.0
+    low = np.array([x.min(), y.min(), z.min()], dtype=np.float64)
+    high = np.array([x.max(), y.max(), z.max()], dtype=np.float64)
+    # the whole path fits from any angle, same as raster_view
+    return float(np.linalg.norm(high - low)) / (0.95 * min(width, height))
+
+
+# indices of the points to keep so that no dropped point is further than tolerance
+# from the simplified path
+def decimate(x, y, z, tolerance, breaks=None):
+    '''
+    Parameters:
+
+    > X, Y, Z: the path
+    > TOLERANCE: the furthest a dropped point may be from the simplified path, in
+        path units
+    > BREAKS: indices that must be kept, the path is simplified in the stretches
+        between them. the first and last points are always kept, as is every
+        MAX_STRETCH-th
+    '''
+
+    n = len(x)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+
+    # one array per axis, gathers from (n, 3) arrays are much slower
+    axes = [np.asarray(v, dtype=np.float64) for v in (x, y, z)]
+
+    keep = np.zeros(n, dtype=bool)
+    keep[::MAX_STRETCH] = True
+    keep[-1] = True
+    if breaks is not None:
+        breaks = np.asarray(breaks, dtype=np.int64)
+        keep[breaks[(breaks >= 0) & (breaks < n)]] = True
+
+    # every stretch between two kept points is a range to simplify
+    fixed = np.flatnonzero(keep)
+    starts = fixed[:-1]
+    ends = fixed[1:]
+
+    while len(starts) > 0:
+
+        # ranges with nothing in between are done
+        inner = ends - starts - 1
+        todo = inner > 0
+        starts, ends, inner = starts[todo], ends[todo], inner[todo]
+        if len(starts) == 0:
+            break
+
+        # every interior point of every range, with the range it belongs to
+        rng = np.repeat(np.arange(len(starts)), inner)
+        offsets = np.cumsum(inner) - inner
+        idx = np.arange(len(rng)) - offsets[rng] + starts[rng] + 1
+
+        # distance of each point from its range's chord
+        s, e = starts[rng], ends[rng]
+        ab = [v[e] - v[s] for v in axes]
+        ap = [v[idx] - v[s] for v in axes]
+        length = ab[0]*ab[0] + ab[1]*ab[1] + ab[2]*ab[2]
+        t = (ap[0]*ab[0] + ap[1]*ab[1] + ap[2]*ab[2]) / np.where(length > 0, length, 1)
+        np.clip(t, 0, 1, out=t)
+        dist = sum((p - d * t)**2 for p, d in zip(ap, ab))
+
+        # the furthest point of each range
+        furthest = np.maximum.reduceat(dist, offsets)
+        split = furthest > tolerance * tolerance
+        if not split.any():
+            break
+
+        # first point per range that reaches the max, every range has one
+        at_max = np.flatnonzero(dist == furthest[rng])
+        first = at_max[np.r_[True, rng[at_max][1:] != rng[at_max][:-1]]]
+
+        # splitting the ranges that are too far off at their furthest point and in the
+        # middle
+        far = idx[first][split]
+        half = (starts[split] + ends[split]) // 2
+        low = np.minimum(far, half)
+        high = np.maximum(far, half)
+        keep[low] = True
+        keep[high] = True
+        starts = np.concatenate([starts[split], low, high])
+        ends = np.concatenate([low, high, ends[split]])
+
+    return np.flatnonzero(keep)
+
+
+# simplifies a path for a given frame plan and image size. returns the kept indices
+# and the frame plan in terms of them
+def simplify(x, y, z, cuts, width, height, quality=QUALITY, breaks=None):
+    '''
+    Parameters:
+
+    > X, Y, Z: the path
+    > CUTS: the frame plan, see frames.py. the last point of every frame is kept so
+        frames end where they did
+    > WIDTH, HEIGHT: the image size in pixels
+    > QUALITY: the tolerance in pixels
+    > BREAKS: other indices to keep, such as layer starts
+    '''
+
+    tolerance = quality * pixel_size(x, y, z, width, height)
+    keep_at = np.asarray(cuts, dtype=np.int64) - 1
+    if breaks is not None:
+        keep_at = np.concatenate([keep_at, np.asarray(breaks, dtype=np.int64)])
+    kept = decimate(x, y, z, tolerance, keep_at)
+
+    # a frame showed the points before its cut, now it shows the kept ones before it
+    return kept, np.searchsorted(kept, cuts)
@@ -0,0 +1,179 @@
+'''
+A software rasterizer for preview videos. The toolpath is sampled into points about
+a pixel apart once, then every frame is a single numpy projection of those points
+into a framebuffer with a z-buffer. Nothing goes through matplotlib, so the camera
+can orbit without mplot3d projecting and sorting every segment in Python.
+
+Select it with gsettings(graphics='raster').
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import math
+import numpy as np
+from contextlib import nullcontext
+from tqdm import tqdm
+from matplotlib import colormaps
+from .video import ffmpeg_pipe
+from .visual import even_cuts
+
+
+# samples past this are spread further apart rather than using more memory
+MAX_SAMPLES = 8000000
+
+
+# the camera's right, up and towards-viewer axes for matplotlib style elev/azim
+def camera(elev, azim):
+    '''
+    Parameters:
+
+    > ELEV, AZIM: the camera angles in degrees, as in mplot3d's view_init
+    '''
+
+    el = math.radians(elev)
+    az = math.radians(azim)
+    right = [-math.sin(az), math.cos(az), 0]
+    up = [-math.sin(el)*math.cos(az), -math.sin(el)*math.sin(az), math.cos(el)]
+    toward = [math.cos(el)*math.cos(az), math.cos(el)*math.sin(az), math.sin(el)]
+    return np.array([right, up, toward], dtype=np.float32).T
+
+
+# turns the path into points about a pixel apart. returns the points, the index of
+# the move each one belongs to, and how many points the first k moves produced
+def sample(x, y, z, step, drawn=None):
+    '''
+    Parameters:
+
+    > X, Y, Z: the path
+    > STEP: the distance between points in path units
+    > DRAWN: true for the points whose segment from the previous point is drawn,
+        all of them by default
+    '''
+
+    pts = np.stack([x, y, z], axis=1).astype(np.float32)
+    delta = pts[1:] - pts[:-1]
+    length = np.sqrt((delta * delta).sum(axis=1))
+
+    # segments that aren't drawn get no points
+    if drawn is not None:
+        length = np.where(drawn[1:], length, 0)
+
+    # keeping memory bounded on huge plates
+    step = max(step, float(length.sum()) / MAX_SAMPLES)
+
+    counts = np.maximum(np.ceil(length / step), 1).astype(np.int64)
+    if drawn is not None:
+        counts[~drawn[1:]] = 0
+    ends = np.cumsum(counts)
+    move = np.repeat(np.arange(len(counts)), counts)
+
+    # position of each point along its segment, 0 at the start
+    along = (np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)) / counts[move]
+    points = pts[move] + delta[move] * along[:, None].astype(np.float32)
+
+    # samples[:done[k]] are the first k moves
+    done = np.concatenate([[0, 0], ends])
+    return points, move, done
+
+
+# renders the print path growing into an orbiting video, like live_view
+def raster_view(x, y, z, loop=None, save_file=None, fps=10, dpi=150,
+                figsize=(6.4, 4.8), sparsity=1, elev=25, azim=-60, spin=True,
+                cmap='plasma', background=(255, 255, 255), crf=0, progress=True,
+                cuts=None, order=None, on_frame=None, drawn=None):
+
+    '''
+    Parameters:
+
+    > X, Y, Z: the path
+    > LOOP: the number of points in the path to draw, all of them by default
+    > SAVE_FILE: the video to write with ffmpeg. frames are rendered but thrown away
+        if not given, which is what the benchmark uses
+    > FPS: frames per second of the video
+    > DPI, FIGSIZE: the resolution is figsize * dpi pixels, same as blit_view
+    > SPARSITY: the number of points added per frame
+    > ELEV, AZIM: the camera. with spin these are ignored and the camera orbits
+        the same way live_view's does
+    > SPIN: orbit the camera
+    > CMAP: the colormap the path is colored by, in print order
+    > BACKGROUND: rgb of the empty framebuffer
+    > CRF: ffmpeg quality, 0 is lossless
+    > PROGRESS: show a progress bar
+    > CUTS: a frame plan from frames.py, frame n shows the path up to cuts[n].
+        overrides sparsity
+    > ORDER: where each point was in the path before it was simplified (lod.py), so
+        the colors stay where they were
+    > ON_FRAME: called with every (height, width, 3) frame, the benchmark uses it
+    > DRAWN: true for the points whose segment from the previous point is drawn, see
+        toolpath.drawn. everything is drawn by default
+    '''
+
+    loop = len(x) if loop is None else loop
+    width = int(figsize[0] * dpi)
+    height = int(figsize[1] * dpi)
+    if cuts is None:
+        cuts = even_cuts(loop, sparsity)
+    frames = len(cuts)
+
+    # fitting the whole path in view from any angle
+    pts = np.stack([x[:loop], y[:loop], z[:loop]], axis=1)
+    low = pts.min(axis=0) if loop > 0 else np.zeros(3)
+    high = pts.max(axis=0) if loop > 0 else np.ones(3)
+    center = ((low + high) / 2).astype(np.float32)
+    radius = max(float(np.linalg.norm(high - low)) / 2, 1e-6)
+    scale = 0.95 * min(width, height) / 2 / radius # pixels per path unit
+
+    # about two points per pixel so lines come out solid
+    points, move, done = sample(x[:loop], y[:loop], z[:loop], 0.5 / scale,
+                                None if drawn is None else drawn[:loop])
+    points -= center
+
+    # colors by position in the print, through a lookup table
+    lut = (colormaps[cmap](np.linspace(0, 1, 256))[:, :3] * 255).astype(np.uint8)
+    if order is None:
+        colors = lut[(move * 255 // max(loop - 2, 1)).clip(0, 255)]
+    else:
+        colors = lut[(order[move] * 255 // max(order[loop - 1] - 1, 1)).clip(0, 255)]
+
+    framebuffer = np.empty((height * width, 3), dtype=np.uint8)
+    zbuffer = np.empty(height * width, dtype=np.float32)
+
+    pipe = ffmpeg_pipe(save_file, width, height, fps=fps, crf=crf, pix_fmt='rgb24') if save_file else nullcontext()
+    with pipe, tqdm(total=frames, disable=not progress) as pbar:
+        for n in range(frames):
+
+            i = min(cuts[n], loop)
+            if spin:
+                view = camera((12.5*math.sin(n/10)) + 17.5, n)
+            else:
+                view = camera(elev, azim)
+
+            # projecting every point drawn so far in one go
+            projected = points[:done[i]] @ view
+            px = (width / 2 + projected[:, 0] * scale).astype(np.int64)
+            py = (height / 2 - projected[:, 1] * scale).astype(np.int64)
+            depth = -projected[:, 2] # smaller is closer
+
+            inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+            pixel = (py * width + px)[inside]
+            depth = depth[inside]
+
+            # nearest point per pixel wins
+            zbuffer.fill(np.inf)
+            np.minimum.at(zbuffer, pixel, depth)
+            visible = depth <= zbuffer[pixel]
+
+            # closer points are drawn a little brighter so the shape reads
+            shade = (1 - 0.35 * (depth[visible] + radius) / (2 * radius))[:, None]
+            framebuffer[:] = background
+            framebuffer[pixel[visible]] = (colors[:done[i]][inside][visible] * shade).astype(np.uint8)
+
+            if save_file:
+                pipe.write(framebuffer.reshape(height, width, 3))
+            if on_frame:
+                on_frame(framebuffer.reshape(height, width, 3))
+            pbar.update(1)
+
+    # end of the raster_view method
+    return frames
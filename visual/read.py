@@ -6,23 +6,36 @@ Written by Ryan Zambrotta (from gcody)
 Modified by Edna
 '''
 from .gcode import gcode
+from .scan import scan, scanstate, marks
+from .stream import lines, blocks
 
 
 # Contains a function to read GCODE from a file and create a gcode object that contains
 # the same information
-def read(file=None, no_travel=False, **kwargs):
+def read(file=None, no_travel=False, mode='full', **kwargs):
     '''
     Parameters:
 
     > FILE: if a file is given, then it is read from or a list
         where each element is each line of GCODE
+    > NO_TRAVEL: drops the moves that don't print from the toolpath (travels,
+        retracts, wipes, z hops), keeping only the start point of each printed run.
+        see toolpath.printed. the layer index is built before they are dropped
+    > MODE: 'full' dispatches every line to the gcode object so it can be written
+        back out. 'analysis' only records the motion, scanned in bulk, which is
+        much faster for previews and statistics
     > KWARGS: these are passed to an empty gcode object when it is constructed
     '''
 
+    if mode == 'analysis':
+        return read_analysis(file, no_travel=no_travel, **kwargs)
+    elif mode != 'full':
+        raise ValueError('Unknown read mode {}'.format(mode))
 
-    # open give file as read only
+
+    # open give file as read only. the file is memory mapped and read line by line
     if isinstance(file, str):
-        f = open(file, 'r')
+        f = (line.decode() for line in lines(file))
 
     # This should just pass a pointer so should be quick and saves a lot of typing
     elif isinstance(file, list):
@@ -40,7 +53,7 @@ def read(file=None, no_travel=False, **kwargs):
     for line in f:
 
         # removes whitespace from the beginning and end of the string
-        line = line.lstrip().rstrip('\n ')
+        line = line.lstrip().rstrip('\r\n ')
 
         # if the line is a blank line
         if line == '':
@@ -208,6 +221,22 @@ def read(file=None, no_travel=False, **kwargs):
                     if i[0] == 'S':
                         k['time'] = i[1:]
 
+            # acceleration of the moves after it
+            elif command[0] == 'M204':
+
+                for i in command[1:]:
+
+                    if len(i) > 1 and i[0] in 'SPTR':
+                        k[i[0].lower()] = float(i[1:])
+
+            # jerk of the moves after it, only x and y are used
+            elif command[0] == 'M205':
+
+                for i in command[1:]:
+
+                    if len(i) > 1 and i[0] in 'XY':
+                        k[i[0].lower()] = float(i[1:])
+
             # Hyrel command to turn extruders off
             elif command[0] == 'M104':
 
@@ -249,5 +278,62 @@ def read(file=None, no_travel=False, **kwargs):
     if isinstance(file, str):
         f.close()
 
+    code.index_layers()
+    if no_travel:
+        code.select(code.path.printed)
+
     # returning the filled gcode object
     return code
+
+
+# Reads only the motion of the GCODE into the toolpath of an empty gcode object.
+# no lines are stored, so the result can't be saved back out
+def read_analysis(file=None, no_travel=False, **kwargs):
+    '''
+    Parameters:
+
+    > FILE: a file name or a list where each element is each line of GCODE
+    > NO_TRAVEL: see read
+    > KWARGS: these are passed to an empty gcode object when it is constructed
+    '''
+
+    # the file is memory mapped and scanned a block at a time so memory use does
+    # not depend on the size of the file
+    if isinstance(file, str):
+        source = blocks(file)
+    elif isinstance(file, list):
+        source = [''.join([line if line.endswith('\n') else line + '\n' for line in file]).encode()]
+    else:
+        raise RuntimeError('Unable to read input data of type {}'.format(type(file)))
+
+    code = gcode(**kwargs)
+
+    # tokenizing each block at once, carrying the modal state between blocks. layer
+    # changes and feature comments are marked at the row they happened
+    state = scanstate()
+    for buf in source:
+        found = marks(buf)
+        cols, state = scan(buf, state, cuts=[offset for offset, _, _ in found])
+
+        rows = len(code.path) + cols['cuts']
+        code.path.extend(cols['pos'], e=cols['e'], f=cols['f'], t=cols['t'],
+                         kind=cols['kind'], motion=cols['motion'], a=cols['a'], j=cols['j'])
+
+        for row, (_, mark, value) in zip(rows.tolist(), found):
+            if mark == 'layer':
+                code.layer_marks.append((row,) + value)
+            else:
+                code.feature_marks.append((row, value))
+
+    code.index_layers()
+    if no_travel:
+        code.select(code.path.printed)
+
+    # leaving the object in the state the last line left the printer in
+    code.current_pos = state.pos.copy()
+    code.print_time = state.time
+    code.print_speed = state.feed
+    code.coords = 'rel' if state.rel_pos else 'abs'
+
+    return code
+
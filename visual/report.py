@@ -0,0 +1,174 @@
+'''
+Per feature breakdown of a sliced plate. Orca starts every feature (outer wall,
+sparse infill, support, ...) with a ;TYPE: comment, or ; FEATURE: for Bambu
+printers, and reading records the row each one starts at. Every move belongs to
+the feature before it, and its extruded length, filament, volume, weight and time
+are summed per feature and per layer with a couple of bincounts.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import numpy as np
+from .toolpath import EXTRUDE
+from .timing import PROFILE
+
+
+# what the moves before the first feature comment count as
+NO_FEATURE = 'Other'
+
+# g/cm3 of generic PLA, what the bot weighs with when nothing better is known.
+# stats.py and the rest of the bot take it from here
+GENERIC_DENSITY = 1.26
+
+# the quantities summed, name -> unit
+QUANTITIES = {'length':'mm', 'filament':'mm', 'volume':'mm3', 'grams':'g', 'time':'s'}
+
+
+# the totals of every feature over the whole plate and in every layer
+class featurereport():
+
+    def __init__(self, names, totals, layers):
+        '''
+        Parameters:
+
+        > NAMES: the feature names, in the order the arrays are in
+        > TOTALS: quantity -> array with one value per feature, see QUANTITIES.
+            length is the distance printed, filament the filament pushed in
+        > LAYERS: quantity -> (layers, features) array
+        '''
+
+        self.names = list(names)
+        self.totals = totals
+        self.layers = layers
+
+        # end of init
+        return
+
+
+    # the share of a quantity each feature has, as a fraction
+    def share(self, quantity='grams'):
+        '''
+        Parameters:
+
+        > QUANTITY: one of QUANTITIES
+        '''
+
+        total = self.totals[quantity].sum()
+        return self.totals[quantity] / total if total > 0 else np.zeros(len(self.names))
+
+
+    # a dictionary of name -> quantity -> total, for the features that print or take
+    # time
+    def to_dict(self):
+        return {name:{q:float(self.totals[q][i]) for q in QUANTITIES}
+                for i, name in enumerate(self.names)
+                if self.totals['filament'][i] > 0 or self.totals['time'][i] > 0}
+
+
+    # a few lines of text, the heaviest features first
+    def summary(self, top=None):
+        '''
+        Parameters:
+
+        > TOP: only the heaviest this many features, all of them if not given
+        '''
+
+        grams = self.totals['grams']
+        time = self.totals['time']
+        share = self.share('grams')
+        # features that neither print nor take a minute are left out, the total has them
+        order = [i for i in np.argsort(-grams) if grams[i] > 0 or time[i] >= 60][:top]
+
+        width = max([len(self.names[i]) for i in order] + [5])
+        lines = ['{:<{w}} {:>8.2f}g {:>4.0%} {:>8}'.format(self.names[i], grams[i], share[i],
+                                                        _duration(time[i]), w=width)
+                 for i in order]
+        lines.append('{:<{w}} {:>8.2f}g      {:>8}'.format('Total', grams.sum(), _duration(time.sum()),
+                                                          w=width))
+        return '\n'.join(lines)
+
+
+    # methods for builtin function access
+    def __getitem__(self, name):
+        i = self.names.index(name)
+        return {q:float(self.totals[q][i]) for q in QUANTITIES}
+
+    def __repr__(self):
+        return 'featurereport({} features)'.format(len(self.names))
+
+
+# breaks down a gcode object read in analysis mode by feature and layer
+def feature_report(code, diameter=1.75, density=GENERIC_DENSITY, times=None, profile=PROFILE):
+    '''
+    Parameters:
+
+    > CODE: the gcode object, read without no_travel so travel time is counted
+    > DIAMETER: the filament diameter in mm
+    > DENSITY: the filament density in g/cm3
+    > TIMES: the seconds of every move, from code.estimate_time if not given
+    > PROFILE: the printer profile the times are worked out with
+
+    * Notes: every move counts towards the feature it is in, travels included.
+        multi material plates are weighed with one density
+    '''
+
+    path = code.path
+    n = len(path)
+    if times is None:
+        times, _ = code.estimate_time(profile)
+
+    # the feature of every row. names are numbered in the order they first appear,
+    # rows before the first comment are NO_FEATURE
+    names = [NO_FEATURE]
+    ids = {NO_FEATURE:0}
+    starts = []
+    codes = []
+    for row, name in code.feature_marks:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        starts.append(row)
+        codes.append(ids[name])
+    starts = np.array(starts, dtype=np.int64)
+    printing = path.motion == EXTRUDE
+    if not code.feature_marks and printing.any():
+        print('No feature comments (;TYPE: or ; FEATURE:), everything counts as ' + NO_FEATURE)
+    codes = np.concatenate([[0], np.array(codes, dtype=np.int64)])
+    feature = codes[np.searchsorted(starts, np.arange(n), side='right')]
+
+    # what each row adds
+    xyz = path.xyz
+    step = np.zeros(n)
+    step[1:] = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+    filament = np.where(printing, path.e, 0).astype(np.float64)
+    volume = filament * np.pi * (diameter / 2) ** 2
+    values = {'length':np.where(printing, step, 0), 'filament':filament, 'volume':volume,
+              'grams':volume / 1000 * density, 'time':np.asarray(times, dtype=np.float64)}
+
+    # one bin per (layer, feature), rows before the first layer go in an extra layer
+    # that only counts towards the totals
+    features = len(names)
+    layers = len(code.layers)
+    layer = code.layers.layer_of(np.arange(n)) + 1
+    bins = layer * features + feature
+    size = (layers + 1) * features
+
+    totals = {}
+    per_layer = {}
+    for quantity, value in values.items():
+        binned = np.bincount(bins, weights=value, minlength=size).reshape(layers + 1, features)
+        totals[quantity] = binned.sum(axis=0)
+        per_layer[quantity] = binned[1:]
+
+    return featurereport(names, totals, per_layer)
+
+
+# seconds as 1h 2m or 3m 4s
+def _duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return '{}h {}m'.format(hours, minutes)
+    return '{}m {}s'.format(minutes, seconds)
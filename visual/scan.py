@@ -0,0 +1,251 @@
+'''
+Bulk GCODE scanner for analysis. Instead of dispatching every line to a gcode
+method, the motion commands of a whole buffer are tokenized with a couple of
+regular expressions and the positions, extrusion, feedrate and time are worked
+out with numpy.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import re
+import numpy as np
+from .toolpath import MOVE, HOME, TRAVEL, classify, move_accel
+
+
+# motion and mode commands, zero padded moves (G00, G01, ...) included. every other
+# line (comments, M codes, ...) is skipped. parameters are captured in the order
+# slicers write them (X Y Z E F), anything left over (arcs, unusual ordering, bare
+# axis letters like G28 X, the S P T R of M204) ends up in the last group and is
+# parsed by hand
+NUMBER = rb'([-+]?[\d.]+)'
+COMMAND = re.compile(rb'^[ \t]*(G0?[0-3]|G28|G90|G91|G92|M82|M83|M204|M205)(?![\d.])'
+                     rb'(?:[ \t]*X' + NUMBER + rb')?(?:[ \t]*Y' + NUMBER + rb')?'
+                     rb'(?:[ \t]*Z' + NUMBER + rb')?(?:[ \t]*E' + NUMBER + rb')?'
+                     rb'(?:[ \t]*F' + NUMBER + rb')?[ \t\r]*([^;\n]*)', re.M)
+
+# group index of each letter in a COMMAND match
+GROUPS = {b'X':1, b'Y':2, b'Z':3, b'E':4, b'F':5}
+LEFTOVER = 6
+
+# letters only ever found in the last group
+PARAMETERS = (b'S', b'P', b'T', b'R')
+
+MOTION = (b'G0', b'G1', b'G2', b'G3', b'G00', b'G01', b'G02', b'G03')
+
+# layer change comments, the z and thickness lines follow it. Orca writes
+# ;LAYER_CHANGE ;Z: ;HEIGHT:, and ; CHANGE_LAYER ; Z_HEIGHT: ; LAYER_HEIGHT: in the
+# Bambu flavour
+LAYER = re.compile(rb'^;[ \t]*(?:LAYER_CHANGE|CHANGE_LAYER)[ \t\r]*\n'
+                   rb'(?:;[ \t]*Z(?:_HEIGHT)?:[ \t]*' + NUMBER + rb'[ \t\r]*\n)?'
+                   rb'(?:;[ \t]*(?:LAYER_)?HEIGHT:[ \t]*' + NUMBER + rb')?', re.M)
+
+# feature comments, everything after it is that feature until the next one. Orca
+# writes ;TYPE:, and ; FEATURE: in the Bambu flavour
+TYPE = re.compile(rb'^;[ \t]*(?:TYPE|FEATURE):[ \t]*([^\r\n]*?)[ \t]*\r?$', re.M)
+
+
+# the modal machine state carried from one scanned buffer to the next
+class scanstate():
+
+    def __init__(self):
+
+        # absolute position of the print head
+        self.pos = np.zeros(3)
+
+        # absolute extruder position
+        self.e = 0.0
+
+        # G91 and M82/M83 modes
+        self.rel_pos = False
+        self.rel_e = False
+
+        # feedrate in units per minute
+        self.feed = 0.0
+
+        # M204 printing, travel and retract accelerations and the M205 xy jerk, 0
+        # until the file sets them
+        self.accel = np.zeros(3)
+        self.jerk = 0.0
+
+        # running print time in minutes
+        self.time = 0.0
+
+        # end of init
+        return
+
+
+# scans a bytes-like buffer (bytes, mmap, memoryview) of complete lines
+def scan(buf, state=None, cuts=()):
+    '''
+    Parameters:
+
+    > BUF: GCODE text as bytes. it must end on a line boundary
+    > STATE: the scanstate left by the previous buffer. a new one is made if not given
+    > CUTS: increasing byte offsets of line starts, such as the marks found by
+        marks(). the number of rows before each one is returned
+
+    Returns a dictionary of arrays, one row per move (pos (n,3), e, f, t, kind,
+    motion, a, j) and the rows before each cut (cuts), and the updated state
+
+    * Notes: arcs (G2/G3) are treated as a straight move to their end point, and
+        moves that only extrude or retract are kept as zero length moves
+    '''
+
+    if state is None:
+        state = scanstate()
+
+    # the buffer is tokenized a piece at a time between cuts, counting the commands
+    # before each one
+    found = []
+    before = []
+    begin = 0
+    for offset in list(cuts) + [len(buf)]:
+        found += COMMAND.findall(buf[begin:offset])
+        before.append(len(found))
+        begin = offset
+    before = np.array(before[:-1], dtype=np.int64)
+
+    n = len(found)
+    if n == 0:
+        return _empty(len(before)), state
+
+    # one array per group. building them column by column is much faster than
+    # handing numpy the list of tuples
+    groups = [np.array(col) for col in zip(*found)]
+    cmds = groups[0]
+
+    # letter -> (given, value) arrays
+    fields = {}
+    for letter, g in GROUPS.items():
+        given = groups[g] != b''
+        value = np.full(n, np.nan)
+        value[given] = groups[g][given].astype(np.float64)
+        fields[letter] = (given, value)
+    for letter in PARAMETERS:
+        fields[letter] = (np.zeros(n, dtype=bool), np.full(n, np.nan))
+
+    # lines the pattern could not fully consume are parsed one by one
+    for i in np.flatnonzero(groups[LEFTOVER] != b''):
+        _reparse(found[i], fields, i)
+
+    motion = np.isin(cmds, MOTION)
+    home = cmds == b'G28'
+    setpos = cmds == b'G92'
+
+    # G91 makes every axis relative, M83 only the extruder. like the slicers do, the
+    # extruder is relative while either of them is active
+    rel_pos = _ffill(np.isin(cmds, (b'G90', b'G91')), cmds == b'G91', state.rel_pos)
+    rel_e = _ffill(np.isin(cmds, (b'M82', b'M83')), cmds == b'M83', state.rel_e)
+
+    # G28 without axes homes all of them
+    any_axis = fields[b'X'][0] | fields[b'Y'][0] | fields[b'Z'][0]
+    home_all = home & ~any_axis
+
+    pos = np.empty((n, 3))
+    for k, letter in enumerate((b'X', b'Y', b'Z')):
+        given, value = fields[letter]
+        reset = (setpos & given) | (home & (given | home_all)) | (motion & given & ~rel_pos)
+        delta = np.where(motion & given & rel_pos, value, 0)
+        pos[:, k] = _accumulate(reset, np.where(home, 0, value), delta, state.pos[k])
+
+    given, value = fields[b'E']
+    e_rel = rel_e | rel_pos
+    reset = (setpos & given) | (motion & given & ~e_rel)
+    delta = np.where(motion & given & e_rel, value, 0)
+    epos = _accumulate(reset, value, delta, state.e)
+    extrude = np.diff(epos, prepend=state.e)
+
+    given, value = fields[b'F']
+    feed = _ffill(motion & given, value, state.feed)
+
+    # M204 S sets the printing and travel acceleration, P and T one each, R the
+    # retract one. M205 X Y set the jerk, the smaller is used for both
+    accel_cmd = cmds == b'M204'
+    (s_given, s_accel), (p_given, p_accel), (t_given, t_accel), (r_given, r_accel) = (fields[x] for x in PARAMETERS)
+    printing = _ffill(accel_cmd & (p_given | s_given), np.where(p_given, p_accel, s_accel), state.accel[0])
+    travel = _ffill(accel_cmd & (t_given | s_given), np.where(t_given, t_accel, s_accel), state.accel[1])
+    retract = _ffill(accel_cmd & r_given, r_accel, state.accel[2])
+    jerk_cmd = (cmds == b'M205') & (fields[b'X'][0] | fields[b'Y'][0])
+    jerk = _ffill(jerk_cmd, np.fmin(fields[b'X'][1], fields[b'Y'][1]), state.jerk)
+
+    # moves that only set the feedrate do not move anything
+    keep = (motion & (any_axis | fields[b'E'][0])) | home
+
+    # distance of each move, falling back to the filament length for E only moves
+    delta = np.diff(pos, axis=0, prepend=state.pos[None, :])
+    dist = np.linalg.norm(delta, axis=1)
+    length = np.where(dist > 0, dist, np.abs(extrude))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dt = np.where(keep & (feed > 0), length / feed, 0)
+    t = state.time + np.cumsum(dt)
+
+    # carrying the modal state over to the next buffer
+    state.pos = pos[-1].copy()
+    state.e = float(epos[-1])
+    state.rel_pos = bool(rel_pos[-1])
+    state.rel_e = bool(rel_e[-1])
+    state.feed = float(feed[-1])
+    state.accel = np.array([printing[-1], travel[-1], retract[-1]])
+    state.jerk = float(jerk[-1])
+    state.time = float(t[-1])
+
+    # what each move does, homing is always a travel
+    motion = np.where(home[keep], TRAVEL, classify(delta[keep], extrude[keep]))
+
+    cols = {'pos':pos[keep], 'e':extrude[keep], 'f':feed[keep], 't':t[keep],
+            'kind':np.where(home[keep], HOME, MOVE), 'motion':motion,
+            'a':move_accel(motion, printing[keep], travel[keep], retract[keep]), 'j':jerk[keep],
+            'cuts':np.concatenate([[0], np.cumsum(keep)])[before]}
+
+    return cols, state
+
+
+# finds the layer changes and feature comments in a buffer, in order. returns
+# (offset, 'layer', (z, height)) for layer changes, z and height are nan when not
+# given, and (offset, 'type', name) for features
+def marks(buf):
+    '''
+    Parameters:
+
+    > BUF: GCODE text as bytes
+    '''
+
+    found = [(m.start(), 'layer', (float(m.group(1)) if m.group(1) else np.nan,
+                                   float(m.group(2)) if m.group(2) else np.nan))
+             for m in LAYER.finditer(buf)]
+    found += [(m.start(), 'type', m.group(1).decode(errors='replace')) for m in TYPE.finditer(buf)]
+    return sorted(found, key=lambda mark: mark[0])
+
+
+# parses the parameters of one command by hand into row I of FIELDS
+def _reparse(match, fields, i):
+    text = b' '.join([letter + match[g] for letter, g in GROUPS.items() if match[g]] + [match[LEFTOVER]])
+    for word in text.split():
+        letter = word[:1]
+        if letter in fields:
+            given, value = fields[letter]
+            given[i] = True
+            value[i] = float(word[1:]) if len(word) > 1 else np.nan
+    return
+
+
+# value of the last row where MASK is set, INITIAL before the first one
+def _ffill(mask, values, initial):
+    idx = np.maximum.accumulate(np.where(mask, np.arange(1, len(mask) + 1), 0))
+    return np.concatenate([[initial], values])[idx]
+
+
+# solves pos[i] = reset[i] ? resetval[i] : pos[i-1] + delta[i] without a python loop
+def _accumulate(reset, resetval, delta, initial):
+    idx = np.maximum.accumulate(np.where(reset, np.arange(1, len(reset) + 1), 0))
+    base = np.concatenate([[initial], resetval])
+    total = np.concatenate([[0], np.cumsum(delta)])
+    return base[idx] + (total[1:] - total[idx])
+
+
+def _empty(cuts=0):
+    return {'pos':np.zeros((0, 3)), 'e':np.zeros(0), 'f':np.zeros(0),
+            't':np.zeros(0), 'kind':np.zeros(0, dtype=np.int8),
+            'motion':np.zeros(0, dtype=np.int8), 'a':np.zeros(0), 'j':np.zeros(0),
+            'cuts':np.zeros(cuts, dtype=np.int64)}
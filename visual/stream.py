@@ -0,0 +1,86 @@
+'''
+Memory-mapped reading of GCODE files. Sliced plates can be hundreds of MB, so
+instead of reading them into a list of strings the file is mapped and handed out
+as line or block slices. Only the pages being looked at are resident.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import mmap
+from contextlib import contextmanager
+
+
+# default block size for blocks()
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+# maps a file read only. yields None for empty files, which mmap refuses to map
+@contextmanager
+def mapped(path, sequential=True):
+    '''
+    Parameters:
+
+    > PATH: the file to map
+    > SEQUENTIAL: hint to the kernel that the file is read front to back so pages
+        behind the reader can be dropped early
+    '''
+
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            yield None
+            return
+
+        try:
+            if sequential and hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield mm
+        finally:
+            mm.close()
+
+
+# yields every line of the file as bytes, including the line ending
+def lines(path):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to read
+    '''
+
+    with mapped(path) as mm:
+        if mm is None:
+            return
+        for line in iter(mm.readline, b''):
+            yield line
+
+
+# yields chunks of about SIZE bytes that always end on a line boundary
+def blocks(path, size=BLOCK_SIZE):
+    '''
+    Parameters:
+
+    > PATH: the GCODE file to read
+    > SIZE: the target size of each block in bytes. a block is only longer than
+        this if a single line is
+    '''
+
+    with mapped(path) as mm:
+        if mm is None:
+            return
+
+        start = 0
+        end = len(mm)
+        while start < end:
+            stop = start + size
+            if stop >= end:
+                stop = end
+            else:
+                # extending the block to the end of the line it stops in
+                newline = mm.find(b'\n', stop - 1)
+                stop = end if newline == -1 else newline + 1
+
+            yield mm[start:stop]
+            start = stop
@@ -0,0 +1,214 @@
+'''
+Print time estimation with acceleration. The running time the scanner keeps is the
+length of each move over its feedrate, which is far too short on the short, fast
+moves of curves and infill: the printer never gets up to speed on them. This works
+out a trapezoidal speed profile for every move with the machine limits of an Orca
+printer profile, over the toolpath columns without a python loop. Moves accelerate at
+what the file asks for with M204 / M205, capped by the machine limits like the
+firmware does, or at the default acceleration of the process profile where it asks
+for nothing.
+
+Junction speeds follow the classic jerk rule (the change of speed on any axis at a
+corner is at most its jerk), then the usual forward and backward passes make sure
+every move can accelerate and brake between them. Those passes are recurrences of
+the form w[i] = min(cap[i], w[i-1] + d[i]) on squared speeds, which a cumulative
+sum and a running minimum solve in one go.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import json
+import numpy as np
+from .toolpath import HOME, EXTRUDE, RETRACT
+
+
+# the printer profile the limits are read from
+PROFILE = 'orca-input/a1.json'
+
+# the process profile the default acceleration is read from
+PROCESS = 'orca-input/standard.json'
+
+# axis order of the limit arrays
+AXES = ('x', 'y', 'z', 'e')
+
+
+# reads the machine limits from an Orca printer profile
+def machine_limits(profile=PROFILE, mode=0, process=PROCESS):
+    '''
+    Parameters:
+
+    > PROFILE: the printer profile json
+    > MODE: Orca lists every limit for normal (0) and silent (1) mode
+    > PROCESS: the process profile json with the default acceleration, None to
+        print at the machine limits
+
+    Returns a dictionary of numpy arrays in x, y, z, e order ('speed' in mm/s,
+    'accel' in mm/s^2, 'jerk' in mm/s), the per move type maximum accelerations
+    ('extruding', 'retracting', 'travel') and the acceleration of moves the file sets
+    none for ('default', 0 for the maximums)
+    '''
+
+    with open(profile, 'r') as f:
+        config = json.load(f)
+
+    default = 0.0
+    if process is not None:
+        with open(process, 'r') as f:
+            default = float(json.load(f).get('default_acceleration', 0) or 0)
+
+    def value(key):
+        v = config[key]
+        if isinstance(v, list):
+            v = v[mode] if mode < len(v) else v[0]
+        return float(v)
+
+    return {'speed':np.array([value('machine_max_speed_' + a) for a in AXES]),
+            'accel':np.array([value('machine_max_acceleration_' + a) for a in AXES]),
+            'jerk':np.array([value('machine_max_jerk_' + a) for a in AXES]),
+            'extruding':value('machine_max_acceleration_extruding'),
+            'retracting':value('machine_max_acceleration_retracting'),
+            'travel':value('machine_max_acceleration_travel'),
+            'default':default}
+
+
+# the seconds every move of a toolpath takes
+def move_times(path, limits=None):
+    '''
+    Parameters:
+
+    > PATH: the toolpath, read in analysis mode without no_travel so every move
+        and its relative extrusion is there
+    > LIMITS: from machine_limits, read from PROFILE and PROCESS if not given
+
+    * Notes: homing takes as long as the scanner says. dwells are not seen
+    '''
+
+    if limits is None:
+        limits = machine_limits()
+
+    n = len(path)
+    if n == 0:
+        return np.zeros(0)
+
+    xyz = path.xyz.astype(np.float64)
+    delta = np.empty((n, 4))
+    delta[0, :3] = 0
+    delta[1:, :3] = xyz[1:] - xyz[:-1]
+    delta[:, 3] = path.e
+
+    # moves that only move the filament are as long as the filament moved
+    length = np.linalg.norm(delta[:, :3], axis=1)
+    length = np.where(length > 0, length, np.abs(delta[:, 3]))
+    moving = (length > 0) & (path.kind != HOME)
+    safe = np.where(moving, length, 1)
+
+    # share of the move on each axis, per unit of length
+    unit = np.abs(delta) / safe[:, None]
+
+    # the feedrate, slowed down so no axis goes past its own limit
+    with np.errstate(divide='ignore'):
+        speed = np.minimum(path.f.astype(np.float64) / 60, (limits['speed'] / unit).min(axis=1))
+        axis_accel = (limits['accel'] / unit).min(axis=1)
+    speed = np.where(moving & (speed > 0), speed, 0)
+
+    # what the file asked for, else the default. retracts without an M204 R go as
+    # fast as the machine allows. the firmware caps all of it at the machine limits
+    motion = path.motion
+    maximum = np.where(motion == EXTRUDE, limits['extruding'],
+                       np.where(motion == RETRACT, limits['retracting'], limits['travel']))
+    default = np.where((motion == RETRACT) | (limits['default'] <= 0), maximum, limits['default'])
+    asked = path.a.astype(np.float64)
+    accel = np.minimum(np.where(asked > 0, asked, default), maximum)
+    accel = np.minimum(accel, axis_accel)
+
+    # M205 lowers the x and y jerk of the moves after it
+    jerk = np.tile(limits['jerk'], (n, 1))
+    asked = path.j.astype(np.float64)
+    jerk[:, :2] = np.where(asked[:, None] > 0, np.minimum(jerk[:, :2], asked[:, None]), jerk[:, :2])
+
+    # signed direction of each move, per unit of length
+    direction = delta / safe[:, None]
+
+    # junction i is the start of move i. moves that don't move are skipped over by
+    # joining each move to the last one that did
+    idx = np.where(moving, np.arange(n), -1)
+    before = np.maximum.accumulate(np.concatenate([[-1], idx[:-1]]))
+    has_before = moving & (before >= 0)
+    prev = np.maximum(before, 0)
+
+    # jerk rule: both sides at the slower speed, scaled down until no axis changes
+    # speed by more than its jerk
+    junction = np.minimum(speed, speed[prev])
+    step = np.abs(direction - direction[prev]) * junction[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(step > 0, jerk / step, np.inf).min(axis=1)
+    junction = junction * np.minimum(scale, 1)
+
+    # starting from rest is limited by jerk alone
+    with np.errstate(divide='ignore'):
+        start = np.minimum(speed, (jerk / unit).min(axis=1))
+    junction = np.where(has_before, junction, start)
+
+    # only moving moves take part in the passes
+    rows = np.flatnonzero(moving)
+    if len(rows) == 0:
+        return np.where(path.kind == HOME, np.diff(path.t, prepend=0) * 60, 0)
+    a = accel[rows]
+    L = length[rows]
+    v = speed[rows]
+    gain = 2 * a * L
+
+    # squared speed at every junction and at the end, where the printer slows to
+    # what jerk allows from a standstill. the forward pass bounds each by the one
+    # before plus what the move between can accelerate, the backward pass by the one
+    # after plus what it can brake. the smaller of the two meets both
+    cap = np.append(junction[rows] ** 2, start[rows[-1]] ** 2)
+    forward = _bounded(cap, np.concatenate([[0], gain]))
+    backward = _bounded(cap[::-1], np.concatenate([[0], gain[::-1]]))[::-1]
+    w = np.sqrt(np.minimum(forward, backward))
+
+    times = np.zeros(n)
+    times[rows] = _trapezoid(L, v, a, w[:-1], w[1:])
+
+    # homing is not planned, the scanner's time is used
+    home = path.kind == HOME
+    times[home] = np.diff(path.t, prepend=0)[home] * 60
+
+    return times
+
+
+# w[i] = min(cap[i], w[i-1] + d[i]) with w[-1] = inf
+def _bounded(cap, d):
+    total = np.cumsum(d)
+    return np.minimum.accumulate(cap - total) + total
+
+
+# time of moves of length L accelerating at A from V0 to at most V and down to V1
+def _trapezoid(L, v, a, v0, v1):
+    v0 = np.minimum(v0, v)
+    v1 = np.minimum(v1, v)
+    up = (v * v - v0 * v0) / (2 * a)
+    down = (v * v - v1 * v1) / (2 * a)
+    cruise = L - up - down
+
+    # too short to reach full speed, the peak is where the ramps meet
+    peak = np.sqrt(np.maximum((2 * a * L + v0 * v0 + v1 * v1) / 2, 0))
+    peak = np.where(cruise >= 0, v, np.minimum(peak, v))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (peak - v0) / a + (peak - v1) / a + np.where(cruise > 0, cruise / v, 0)
+    return np.where(np.isfinite(t), t, 0)
+
+
+# seconds per layer from the seconds per move
+def layer_times(times, layers):
+    '''
+    Parameters:
+
+    > TIMES: from move_times
+    > LAYERS: the layerindex of the same toolpath, see layers.py
+    '''
+
+    total = np.concatenate([[0], np.cumsum(times)])
+    return total[layers.end] - total[layers.start]
@@ -0,0 +1,288 @@
+'''
+Columnar storage of the motion history of a gcode object
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import numpy as np
+
+
+# move type codes stored in the kind column
+MOVE = 0 # G0/G1/G2/G3 motion
+HOME = 1 # G28
+DWELL = 2 # G4
+
+# motion class codes stored in the motion column, what a move does to the print
+TRAVEL = 0 # moves without extruding, including homing
+EXTRUDE = 1 # moves that lay down filament
+RETRACT = 2 # only the filament moves, retracts and the primes that undo them
+WIPE = 3 # moves that retract while moving, wipes
+ZHOP = 4 # only z moves and nothing extrudes, z hops and layer changes
+
+# the motion classes that put plastic on the bed, what previews draw
+PRINTING = (EXTRUDE,)
+
+# extrusion smaller than this doesn't count either way
+MIN_EXTRUDE = 1e-5
+
+
+# the motion class of each move from its change in position and its extrusion
+def classify(delta, e):
+    '''
+    Parameters:
+
+    > DELTA: array of shape (n,3), the change in position of each move
+    > E: the extrusion of each move, relative
+    '''
+
+    delta = np.asarray(delta)
+    e = np.asarray(e)
+    xy = (delta[:, 0] != 0) | (delta[:, 1] != 0)
+    dz = delta[:, 2] != 0
+
+    motion = np.full(len(e), TRAVEL, dtype=np.int8)
+    motion[~xy & dz] = ZHOP
+    motion[~xy & (np.abs(e) > MIN_EXTRUDE)] = RETRACT
+    motion[xy & (e < -MIN_EXTRUDE)] = WIPE
+    motion[xy & (e > MIN_EXTRUDE)] = EXTRUDE
+    return motion
+
+
+# the acceleration a file set for each move with M204, 0 where it set none. printing
+# moves take the printing one, filament only moves the retract one and the rest travel
+def move_accel(motion, printing, travel, retract):
+    '''
+    Parameters:
+
+    > MOTION: the motion class of each move
+    > PRINTING, TRAVEL, RETRACT: the M204 P, T and R values in force at each move, or
+        scalars. S sets both P and T
+    '''
+
+    motion = np.asarray(motion)
+    return np.where(motion == EXTRUDE, printing, np.where(motion == RETRACT, retract, travel))
+
+
+# growable, preallocated column buffers. one row per recorded motion
+class toolpath():
+
+    # column name -> dtype. positions and extrusion are fine in float32 (sub micron
+    # on a 256mm bed), time is a running total so it keeps float64. a and j are the
+    # acceleration (M204) and xy jerk (M205) the file set for the move, 0 if none
+    columns = {'x':np.float32, 'y':np.float32, 'z':np.float32,
+               'e':np.float32, 'f':np.float32, 't':np.float64, 'kind':np.int8,
+               'motion':np.int8, 'a':np.float32, 'j':np.float32}
+
+    def __init__(self, capacity=4096):
+        '''
+        Parameters:
+
+        > CAPACITY: the number of rows to preallocate. buffers double when full
+        '''
+
+        # number of rows written
+        self.count = 0
+
+        # positions are stored as one (n,3) block so xyz is a view and not a copy
+        self._pos = np.zeros((capacity, 3), dtype=np.float32)
+
+        # every other column is its own 1d buffer
+        self._cols = {name:np.zeros(capacity, dtype=dtype) for name, dtype
+                      in self.columns.items() if name not in ('x', 'y', 'z')}
+
+        # end of init
+        return
+
+
+    # the number of rows the buffers can hold before growing
+    @property
+    def capacity(self):
+        return self._pos.shape[0]
+
+
+    # makes sure there is room for N more rows
+    def reserve(self, n):
+        '''
+        Parameters:
+
+        > N: the number of rows about to be written
+        '''
+
+        need = self.count + n
+        if need <= self.capacity:
+            return
+
+        # doubling keeps appends amortized O(1)
+        size = max(need, self.capacity * 2)
+
+        pos = np.zeros((size, 3), dtype=np.float32)
+        pos[:self.count] = self._pos[:self.count]
+        self._pos = pos
+
+        for name, col in self._cols.items():
+            grown = np.zeros(size, dtype=col.dtype)
+            grown[:self.count] = col[:self.count]
+            self._cols[name] = grown
+
+        return
+
+
+    # records a single motion
+    def append(self, pos, e=0, f=0, t=0, kind=MOVE, motion=TRAVEL, a=0, j=0):
+        '''
+        Parameters:
+
+        > POS: the absolute position moved to, shape (3,)
+        > E: the extrusion of this motion
+        > F: the feedrate of this motion in units per minute
+        > T: the running print time at the end of this motion in minutes
+        > KIND: one of the move type codes at the top of this module
+        > MOTION: one of the motion class codes at the top of this module
+        > A: the acceleration set for this motion in units/s^2, 0 if none
+        > J: the xy jerk set for this motion in units/s, 0 if none
+        '''
+
+        if self.count == self.capacity:
+            self.reserve(1)
+
+        i = self.count
+        self._pos[i] = pos
+        self._cols['e'][i] = e
+        self._cols['f'][i] = f
+        self._cols['t'][i] = t
+        self._cols['kind'][i] = kind
+        self._cols['motion'][i] = motion
+        self._cols['a'][i] = a
+        self._cols['j'][i] = j
+        self.count += 1
+
+        return
+
+
+    # records many motions at once. any column can be a scalar or an array of length n
+    def extend(self, pos, **cols):
+        '''
+        Parameters:
+
+        > POS: array of shape (n,3) of absolute positions
+        > COLS: keyword arrays (or scalars) for e, f, t, kind, motion, a and j
+        '''
+
+        n = len(pos)
+        if n == 0:
+            return
+
+        self.reserve(n)
+
+        s = slice(self.count, self.count + n)
+        self._pos[s] = pos
+        for name, value in cols.items():
+            self._cols[name][s] = value
+        self.count += n
+
+        return
+
+
+    # zero copy views of the written rows ------------------------------------------
+    @property
+    def xyz(self):
+        return self._pos[:self.count]
+
+    @property
+    def x(self):
+        return self._pos[:self.count, 0]
+
+    @property
+    def y(self):
+        return self._pos[:self.count, 1]
+
+    @property
+    def z(self):
+        return self._pos[:self.count, 2]
+
+    @property
+    def e(self):
+        return self._cols['e'][:self.count]
+
+    @property
+    def f(self):
+        return self._cols['f'][:self.count]
+
+    @property
+    def t(self):
+        return self._cols['t'][:self.count]
+
+    @property
+    def kind(self):
+        return self._cols['kind'][:self.count]
+
+    @property
+    def motion(self):
+        return self._cols['motion'][:self.count]
+
+    @property
+    def a(self):
+        return self._cols['a'][:self.count]
+
+    @property
+    def j(self):
+        return self._cols['j'][:self.count]
+
+
+    # true for the rows whose motion class is one of MOTIONS
+    def mask(self, *motions):
+        '''
+        Parameters:
+
+        > MOTIONS: motion class codes, see the top of this module
+        '''
+
+        return np.isin(self.motion, motions)
+
+
+    # true for the rows that end a segment a preview draws
+    @property
+    def drawn(self):
+        return self.mask(*PRINTING)
+
+
+    # a new toolpath with only some of the rows
+    def select(self, rows):
+        '''
+        Parameters:
+
+        > ROWS: boolean array with one per row, or a slice of rows
+        '''
+
+        rows = np.arange(self.count)[rows]
+        path = toolpath(max(len(rows), 1))
+        path.extend(self.xyz[rows], **{name:col[:self.count][rows] for name, col in self._cols.items()})
+        return path
+
+
+    # true for the rows a preview needs, select them to drop the rest. the row before
+    # each printing move is kept as its start point, so the segments between kept rows
+    # that end on a non printing row are jumps and the rest are exactly the printed ones
+    @property
+    def printed(self):
+        drawn = self.drawn
+        start = np.zeros_like(drawn)
+        start[:-1] = drawn[1:]
+        return drawn | start
+
+
+    # drops the unused tail of the buffers once nothing else will be written
+    def trim(self):
+        self._pos = self._pos[:self.count].copy()
+        for name, col in self._cols.items():
+            self._cols[name] = col[:self.count].copy()
+        return
+
+
+    # methods for builtin function access
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return 'toolpath({} moves)'.format(self.count)
@@ -0,0 +1,69 @@
+'''
+Writes raw frames straight into ffmpeg's stdin. Matplotlib's movie writers call
+savefig for every frame, which redraws the whole figure; the renderers here already
+have the pixels, so they are handed over as they are.
+
+Written by Edna
+'''
+
+# imports -----------------------------------------------------------------------
+import subprocess
+import numpy as np
+
+
+# an ffmpeg process encoding frames of a fixed size, use as a context manager
+class ffmpeg_pipe():
+
+    def __init__(self, save_file, width, height, fps=10, crf=0, codec='libx264',
+                 pix_fmt='rgba', ffmpeg='ffmpeg'):
+        '''
+        Parameters:
+
+        > SAVE_FILE: the video file to write
+        > WIDTH, HEIGHT: the frame size in pixels. yuv420p needs them even, odd
+            sizes are cropped by a pixel
+        > FPS: frames per second of the video
+        > CRF: constant rate factor, 0 is lossless
+        > CODEC: the ffmpeg video codec
+        > PIX_FMT: the layout of the frames written, rgba or rgb24
+        > FFMPEG: the ffmpeg executable
+        '''
+
+        # yuv420p can't do odd sizes
+        self.width = width - width % 2
+        self.height = height - height % 2
+        self.channels = 4 if pix_fmt == 'rgba' else 3
+
+        self.cmd = [ffmpeg, '-y', '-loglevel', 'error',
+                    '-f', 'rawvideo', '-pix_fmt', pix_fmt,
+                    '-s', '{}x{}'.format(self.width, self.height), '-r', str(fps),
+                    '-i', '-',
+                    '-c:v', codec, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+                    save_file]
+        self.proc = None
+
+        # end of init
+        return
+
+    def __enter__(self):
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE)
+        return self
+
+    # writes one (height, width, channels) uint8 frame
+    def write(self, frame):
+        '''
+        Parameters:
+
+        > FRAME: an array at least width x height pixels big, extra rows and columns
+            are cropped
+        '''
+
+        frame = np.asarray(frame)[:self.height, :self.width, :self.channels]
+        self.proc.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+
+    def __exit__(self, *exc):
+        self.proc.stdin.close()
+        code = self.proc.wait()
+        if code != 0 and exc[0] is None:
+            raise RuntimeError('ffmpeg exited with {}'.format(code))
+        return False
@@ -535,6 +535,150 @@ def live_view(animate, *args, loop=60, ax_lim=None, ax_label=None,
     return
 
 
+# renders the same growing print path as live_view, but each frame only rasterizes the
+# segments that are new in it. everything drawn before stays in the canvas buffer
+# instead of being redrawn as one more artist every frame
+def blit_view(animate, loop=60, ax_lim=None, ax_label=None, fig_title=None,
+              save_file=None, fps=10, dpi=100, figsize=(6.4, 4.8), sparsity=1,
+              elev=25, azim=-60, spin=False, cmap='plasma', linewidth=0.1, crf=0,
+              plot_style='default', progress=True, cuts=None, drawn=None):
+
+    '''
+    Parameters:
+
+    > ANIMATE: A function that takes a start and end index and returns the x,y,z of
+        the path between them
+    > LOOP: the number of points in the path
+    > AX_LIM: x,y,z axis limits in x,y,z order from low to high
+    > AX_LABEL: a list-like object that contains strings for the x,y,z labels in that order
+    > FIG_TITLE:
+    > SAVE_FILE: the video to write with ffmpeg. frames are rendered but thrown away
+        if not given, which is what the benchmark uses
+    > FPS: frames per second of the video
+    > DPI, FIGSIZE: the resolution is figsize * dpi pixels
+    > SPARSITY: the number of points added per frame
+    > ELEV, AZIM: the fixed camera
+    > SPIN: rotate the camera like live_view does. the old drawing can't be kept when
+        the camera moves, so every frame is redrawn (from a single artist though)
+    > CMAP: the colormap the path is colored by, in print order
+    > LINEWIDTH:
+    > CRF: ffmpeg quality, 0 is lossless
+    > PLOT_STYLE:
+    > PROGRESS: show a progress bar
+    > CUTS: a frame plan from frames.py, frame n shows the path up to cuts[n].
+        overrides sparsity
+    > DRAWN: true for the points whose segment from the previous point is drawn, see
+        toolpath.drawn. everything is drawn by default
+    '''
+
+    # need imports
+    from contextlib import nullcontext
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+    from .video import ffmpeg_pipe
+
+    # maplotlib style to use
+    style.use(plot_style)
+
+    # a bare agg figure, so no gui backend or pyplot state is involved
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d', computed_zorder=False)
+    ax.set_aspect('equal')
+    ax.autoscale(False)
+
+    # setting axis sizes
+    if ax_lim != None:
+        ax.set_xlim(ax_lim[0], ax_lim[1])
+        ax.set_ylim(ax_lim[2], ax_lim[3])
+        ax.set_zlim(ax_lim[4], ax_lim[5])
+
+    # labeling axes
+    if ax_label != None:
+        ax.set_xlabel(ax_label[0])
+        ax.set_ylabel(ax_label[1])
+        ax.set_zlabel(ax_label[2])
+
+    # setting figure title
+    if fig_title:
+        ax.set_title(fig_title)
+
+    ax.view_init(elev=elev, azim=azim)
+    colormap = plt.get_cmap(cmap)
+    if cuts is None:
+        cuts = even_cuts(loop, sparsity)
+    frames = len(cuts)
+
+    # the empty axes, drawn once. with a fixed camera this buffer is the background
+    # every later frame is drawn on top of
+    canvas.draw()
+    renderer = canvas.get_renderer()
+    width, height = canvas.get_width_height()
+
+    # spinning keeps one collection that grows and is redrawn with the axes
+    if spin:
+        drawn_segments = []
+        drawn_colors = []
+        collection = Line3DCollection([], linewidths=linewidth)
+        ax.add_collection(collection, autolim=False)
+
+    pipe = ffmpeg_pipe(save_file, width, height, fps=fps, crf=crf) if save_file else nullcontext()
+    with pipe, tqdm(total=frames, disable=not progress) as pbar:
+        for n in range(frames):
+
+            # the points new in this frame, starting one back so chunks connect
+            s = cuts[n - 1] if n > 0 else 0
+            i = cuts[n]
+            x, y, z = animate(s - 1 if s > 0 else 0, i)
+            segments = make_segments_3d(x, y, z)
+            colors = colormap(np.linspace(s / loop, i / loop, max(len(segments), 1)))[:len(segments)]
+            if drawn is not None and len(segments) > 0:
+                # dropping the jumps, a segment is drawn if the point it ends on is
+                shown = drawn[max(s - 1, 0) + 1:i]
+                segments, colors = segments[shown], colors[shown]
+
+            if spin:
+                ax.view_init(elev=(12.5*math.sin(n/10)) + 17.5, azim=n)
+                drawn_segments.append(segments)
+                drawn_colors.append(colors)
+                collection.set_segments(np.concatenate(drawn_segments))
+                collection.set_color(np.concatenate(drawn_colors))
+                canvas.draw()
+
+            elif len(segments) > 0:
+                # only the new segments are projected and rasterized
+                new = Line3DCollection(segments, colors=colors, linewidths=linewidth)
+                new.axes = ax
+                new.set_figure(fig)
+                new.set_transform(ax.transData)
+                new.set_clip_path(ax.patch)
+                new.do_3d_projection()
+                new.draw(renderer)
+
+            if save_file:
+                pipe.write(np.asarray(canvas.buffer_rgba()).reshape(height, width, 4))
+            pbar.update(1)
+
+    # end of the blit_view method
+    return frames
+
+
+# the frame plan of sparsity points per frame, with the last frame showing everything
+def even_cuts(loop, sparsity):
+    '''
+    Parameters:
+
+    > LOOP: the number of points in the path
+    > SPARSITY: the number of points added per frame
+    '''
+
+    sparsity = sparsity if sparsity > 0 else 1
+    cuts = np.arange(1, max(loop // sparsity, 1) + 1) * sparsity
+    cuts[-1] = loop
+    return cuts
+
+
 # help from
 # https://matplotlib.org/gallery/widgets/slider_demo.html
 def slider_view(update, *args, slide_geo=[0.25, 0.1, 0.65, 0.03],